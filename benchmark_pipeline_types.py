@@ -0,0 +1,122 @@
+import sys
+import os
+import io
+import json
+import time
+import argparse
+import subprocess
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+project_root = os.getcwd()
+sys.path.append(project_root)
+from src.pipeline.main import DataPipeline, peak_rss_mb
+
+# Compara memoria, tiempo y tamaño de archivo de process_atenciones con el backend de pandas
+# por defecto (object) y con el backend pyarrow + esquemas tipados (--arrow), sobre un
+# atenciones.csv sintético con la misma forma y cardinalidades que data/raw/atenciones.csv.
+
+ESTADOS = ["Pendiente", "cancelada", "Cancelada", "PENDIENTE", "CERRADA", "ACTIVA"]
+CANALES = ["APP", "WEB", "CALL_CENTER"]
+MEDICOS = ["Dr. Gomez", "Dr. Perez", "Dr. Lopez", "Dra. Ruiz", "Dra. Diaz"]
+
+
+def generate_atenciones(path, rows, block=1_000_000, seed=7):
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2025-01-01T00:00:00")
+    # ~3% of the ids are re-sent later with a newer fecha_atencion, like the sample data
+    unique_ids = int(rows / 1.03)
+    with open(path, "w") as f:
+        f.write("id_atencion,id_cliente,documento_cliente,fecha_atencion,fecha_proceso,valor_facturado,"
+                "estado,codigo_cups,canal_ingreso,json_detalle\n")
+        for offset in range(0, rows, block):
+            n = min(block, rows - offset)
+            ids = np.arange(offset, offset + n) + 1
+            ids = np.where(ids > unique_ids, rng.integers(1, unique_ids, n), ids)
+            seconds = rng.integers(0, 400 * 86400, n)
+            fechas = start + seconds.astype("timedelta64[s]")
+            documentos = rng.integers(10_000_000, 99_999_999, n).astype(str).astype(object)
+            dirty = rng.random(n) < 0.01
+            documentos[dirty] = documentos[dirty] + "X"
+            diagnosticos = rng.integers(1, 200, n)
+            medicos = rng.choice(MEDICOS, n)
+            detalle = np.array([f'{{"diagnostico": "DX{d}", "medico": "{m}"}}' for d, m in zip(diagnosticos, medicos)],
+                               dtype=object)
+            malformed = rng.random(n) < 0.05
+            detalle[malformed] = "{'diagnostico': 'DX1'}"
+            block_df = pd.DataFrame({
+                "id_atencion": ids,
+                "id_cliente": rng.integers(1, 2_000_000, n),
+                "documento_cliente": documentos,
+                "fecha_atencion": pd.to_datetime(fechas).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+                "fecha_proceso": pd.to_datetime(fechas).strftime("%Y-%m-%d"),
+                "valor_facturado": np.round(rng.normal(0, 300_000, n), 2),
+                "estado": rng.choice(ESTADOS, n),
+                "codigo_cups": rng.integers(1000, 9999, n),
+                "canal_ingreso": rng.choice(CANALES, n),
+                "json_detalle": detalle,
+            })
+            block_df.to_csv(f, header=False, index=False)
+
+
+def measure(mode, workdir):
+    """Runs process_atenciones in this (fresh) process and prints its measurements as JSON."""
+    output_dir = os.path.join(workdir, f"out_{mode}")
+    os.makedirs(output_dir, exist_ok=True)
+    pipeline = DataPipeline(workdir, output_dir, arrow=(mode == "arrow"))
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        df = pipeline.process_atenciones()
+    elapsed = time.perf_counter() - start
+    output_path = os.path.join(output_dir, "atenciones_cleaned.parquet")
+    print(json.dumps({
+        "mode": mode,
+        "rows_out": len(df),
+        "wall_seconds": round(elapsed, 2),
+        "dataframe_mb": round(df.drop(columns=["json_detalle"]).memory_usage(deep=True).sum() / 2**20, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "parquet_mb": round(os.path.getsize(output_path) / 2**20, 1),
+        "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+    }))
+
+
+def run_benchmark(rows, workdir):
+    os.makedirs(workdir, exist_ok=True)
+    csv_path = os.path.join(workdir, "atenciones.csv")
+    if not os.path.exists(csv_path) or sum(1 for _ in open(csv_path)) - 1 != rows:
+        print(f"Generating {rows:,} synthetic atenciones in {csv_path}...")
+        generate_atenciones(csv_path, rows)
+
+    results = []
+    for mode in ["object", "arrow"]:
+        # Separate processes so peak RSS is not shared between modes
+        out = subprocess.run([sys.executable, __file__, "--measure", mode, "--workdir", workdir],
+                             check=True, capture_output=True, text=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print("\n" + "=" * 80)
+    print(f"ATENCIONES TYPES BENCHMARK ({rows:,} rows)")
+    print("=" * 80)
+    print(f"{'mode':<8}{'wall s':>10}{'DataFrame MB':>15}{'peak RSS MB':>14}{'parquet MB':>12}")
+    for r in results:
+        print(f"{r['mode']:<8}{r['wall_seconds']:>10}{r['dataframe_mb']:>15}{r['peak_rss_mb']:>14}{r['parquet_mb']:>12}")
+    print("=" * 80)
+
+    with open(os.path.join(workdir, "benchmark_pipeline_types.json"), "w") as f:
+        json.dump({"rows": rows, "results": results}, f, indent=4)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory/file-size benchmark: object vs arrow dtypes")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Synthetic atenciones rows")
+    parser.add_argument("--workdir", default="output/benchmark_types", help="Where the CSV and outputs are written")
+    parser.add_argument("--measure", choices=["object", "arrow"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.workdir)
+    else:
+        run_benchmark(args.rows, args.workdir)
@@ -0,0 +1,93 @@
+import sys
+import os
+import io
+import json
+import time
+import argparse
+from contextlib import redirect_stdout
+
+import numpy as np
+
+project_root = os.getcwd()
+sys.path.append(project_root)
+from src.rag.chunker import iter_kb_chunks
+from src.rag.rag_engine import RAGSystem, ENCODE_BATCH_SIZE
+
+# Compara configuraciones de generación de embeddings para reindexar la base de conocimientos:
+# chunks por segundo y desviación coseno frente a los embeddings fp32 de la ruta original
+# (model.encode sobre todos los chunks en un solo proceso). Los chunks de data/raw/kb se
+# replican --repeat veces para que la medición no la dominen los costos fijos.
+
+
+def load_texts(kb_dir, repeat):
+    return [text for _, _, texts in iter_kb_chunks(kb_dir) for text in texts] * repeat
+
+
+def timed(encode, texts):
+    start = time.perf_counter()
+    embeddings = encode(texts)
+    return embeddings, time.perf_counter() - start
+
+
+def run_benchmark(kb_dir, model_name, repeat, batch_sizes, workers):
+    texts = load_texts(kb_dir, repeat)
+    settings = [("original", {})]
+    # En un solo proceso encode_texts llama a model.encode, que ya ordena por longitud: solo cambia el lote
+    settings += [(f"batch b={b}", {"encode_batch_size": b}) for b in batch_sizes]
+    if workers > 1:
+        # El pool recibe los textos ordenados por longitud y los reparte en bloques contiguos
+        settings.append((f"sorted pool x{workers}", {"encode_workers": workers}))
+    settings.append((f"int8 b={ENCODE_BATCH_SIZE}", {"quantize": True}))
+
+    results, reference = [], None
+    for label, kwargs in settings:
+        with redirect_stdout(io.StringIO()):
+            rag = RAGSystem(kb_dir=kb_dir, model_name=model_name, cache_dir=None, **kwargs)
+        if label == "original":
+            def encode(batch):
+                return np.array(rag.model.encode(batch, normalize_embeddings=True)).astype('float32')
+        else:
+            encode = rag.encode_texts
+        # Calentamiento (y arranque del pool de procesos, que no se cuenta)
+        encode(texts[:2 * ENCODE_BATCH_SIZE + 1])
+        try:
+            embeddings, seconds = timed(encode, texts)
+        finally:
+            rag.stop_encode_pool()
+        if reference is None:
+            reference = embeddings
+        drift = 1.0 - (embeddings * reference).sum(axis=1)
+        results.append({
+            "setting": label,
+            "chunks_per_second": round(len(texts) / seconds, 1),
+            "seconds": round(seconds, 2),
+            "mean_cosine_drift": float(f"{drift.mean():.2e}"),
+            "max_cosine_drift": float(f"{drift.max():.2e}"),
+        })
+
+    print("\n" + "=" * 80)
+    print(f"EMBEDDING THROUGHPUT ({len(texts):,} chunks, model={model_name}, {os.cpu_count()} CPUs)")
+    print("=" * 80)
+    print(f"{'setting':<20}{'chunks/s':>12}{'seconds':>10}{'mean drift':>14}{'max drift':>14}")
+    for r in results:
+        print(f"{r['setting']:<20}{r['chunks_per_second']:>12}{r['seconds']:>10}"
+              f"{r['mean_cosine_drift']:>14.2e}{r['max_cosine_drift']:>14.2e}")
+    print("Drift = 1 - coseno frente a 'original' (fp32).")
+    print("=" * 80)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunks/s and cosine drift of the RAG embedding settings")
+    parser.add_argument("--kb-dir", default="data/raw/kb")
+    parser.add_argument("--model", default="paraphrase-multilingual-MiniLM-L12-v2")
+    parser.add_argument("--repeat", type=int, default=20, help="Copies of the KB chunks to encode")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[ENCODE_BATCH_SIZE, 128])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes of the encode pool")
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.kb_dir, args.model, args.repeat, args.batch_sizes, args.workers)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,92 @@
+import sys
+import os
+import json
+import time
+import argparse
+
+import faiss
+import numpy as np
+
+project_root = os.getcwd()
+sys.path.append(project_root)
+from src.rag.ann_index import INDEX_TYPES, create_index, configure_search, index_bytes
+
+# Compara los backends ANN de src/rag/ann_index.py sobre embeddings sintéticos normalizados
+# (mezcla de gaussianas con la dimensión de paraphrase-multilingual-MiniLM-L12-v2): recall@k
+# frente al índice exacto (flat), consultas por segundo, memoria del índice y tiempo de construcción.
+
+DIMENSION = 384
+
+
+def synthetic_embeddings(n, n_queries, d=DIMENSION, clusters=256, seed=7):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, d)).astype('float32')
+    def sample(count):
+        points = centers[rng.integers(0, clusters, count)] + 0.6 * rng.normal(size=(count, d)).astype('float32')
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+    return sample(n), sample(n_queries)
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def run_benchmark(n, n_queries, k, metric, sweep):
+    embeddings, queries = synthetic_embeddings(n, n_queries)
+    exact = create_index(embeddings, "flat", metric)
+    _, truth = exact.search(queries, k)
+
+    results = []
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = create_index(embeddings, index_type, metric)
+        build_seconds = time.perf_counter() - start
+        # Sweep the search-time knob where there is one
+        if index_type in ("ivf", "ivfpq"):
+            settings = [{"nprobe": v} for v in sweep["nprobe"]]
+        elif index_type == "hnsw":
+            settings = [{"ef_search": v} for v in sweep["ef_search"]]
+        else:
+            settings = [{}]
+        for setting in settings:
+            configure_search(index, **setting)
+            start = time.perf_counter()
+            _, found = index.search(queries, k)
+            elapsed = time.perf_counter() - start
+            results.append({
+                "index_type": index_type,
+                "search_params": setting,
+                f"recall_at_{k}": round(recall_at_k(found, truth), 4),
+                "qps": round(n_queries / elapsed, 1),
+                "index_mb": round(index_bytes(index) / 2**20, 1),
+                "build_seconds": round(build_seconds, 2),
+            })
+
+    print("\n" + "=" * 80)
+    print(f"ANN INDEX BENCHMARK ({n:,} vectors, d={DIMENSION}, {n_queries} queries, k={k}, metric={metric}, "
+          f"{faiss.omp_get_max_threads()} threads)")
+    print("=" * 80)
+    print(f"{'index':<11}{'params':<18}{f'recall@{k}':>10}{'QPS':>12}{'index MB':>10}{'build s':>9}")
+    for r in results:
+        params = ",".join(f"{key}={value}" for key, value in r["search_params"].items()) or "-"
+        print(f"{r['index_type']:<11}{params:<18}{r[f'recall_at_{k}']:>10}{r['qps']:>12}{r['index_mb']:>10}"
+              f"{r['build_seconds']:>9}")
+    print("=" * 80)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/QPS/memory benchmark of the RAG ANN backends")
+    parser.add_argument("--vectors", type=int, default=100_000, help="Synthetic chunk embeddings")
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("-k", type=int, default=15, help="Neighbours per query (RAGSystem.ask uses 15)")
+    parser.add_argument("--metric", choices=["l2", "ip"], default="l2")
+    parser.add_argument("--output", help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.vectors, args.queries, args.k, args.metric,
+                            sweep={"nprobe": [1, 8, 32], "ef_search": [16, 64, 256]})
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,68 @@
+import sys
+import os
+import io
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+import spacy
+
+project_root = os.getcwd()
+sys.path.append(project_root)
+from src.rag.rag_engine import RAGSystem
+from stress_test_rag import tech_queries, noise_queries
+
+# Compara la latencia de ask() sobre las preguntas de stress_test_rag.py entre la ruta original
+# (pipeline completo de spaCy y lemas de los 15 chunks candidatos recalculados en cada consulta)
+# y la actual (lemas y texto normalizado precalculados al indexar, pipeline sin parser/NER).
+
+
+def timed_answers(rag, queries, repeat):
+    answers, latencies = {}, []
+    for _ in range(repeat):
+        for q in queries:
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                answers[q] = rag.ask(q)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return answers, np.array(latencies)
+
+
+def run_comparison(repeat=3):
+    with redirect_stdout(io.StringIO()):
+        # Sin caché de respuestas: cada repetición debe recorrer la ruta completa
+        rag = RAGSystem(kb_dir='data/raw/kb', answer_cache_size=0)
+        rag.load_and_chunk()
+        rag.build_index()
+    queries = tech_queries + noise_queries
+
+    # Calentamiento: la primera consulta paga la carga perezosa de los modelos
+    timed_answers(rag, queries[:1], 1)
+    optimized, optimized_ms = timed_answers(rag, queries, repeat)
+
+    annotated, trimmed_nlp = rag.metadata, rag.nlp
+    rag.metadata = [{"file": meta["file"], "text": meta["text"]} for meta in annotated]
+    rag.nlp = spacy.load("es_core_news_lg") if trimmed_nlp else None
+    try:
+        timed_answers(rag, queries[:1], 1)
+        original, original_ms = timed_answers(rag, queries, repeat)
+    finally:
+        rag.metadata, rag.nlp = annotated, trimmed_nlp
+
+    changed = [q for q in queries if original[q] != optimized[q]]
+    print("\n" + "=" * 80)
+    print(f"ASK LATENCY ({len(queries)} stress-test queries x {repeat})")
+    print("=" * 80)
+    print(f"{'path':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, ms in [("original", original_ms), ("precomputed", optimized_ms)]:
+        print(f"{label:<12}{ms.mean():>10.2f}{np.percentile(ms, 50):>10.2f}{np.percentile(ms, 95):>10.2f}")
+    print(f"Speedup (mean): {original_ms.mean() / optimized_ms.mean():.1f}x")
+    print(f"Identical answers: {len(queries) - len(changed)}/{len(queries)}")
+    for q in changed:
+        print(f"  CHANGED: {q}")
+    print("=" * 80)
+    return not changed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_comparison() else 1)
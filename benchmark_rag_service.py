@@ -0,0 +1,212 @@
+import sys
+import os
+import io
+import json
+import time
+import asyncio
+import logging
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+import httpx
+import numpy as np
+
+project_root = os.getcwd()
+sys.path.append(project_root)
+from src.api.metrics import peak_memory_bytes
+from src.rag.answer_cache import AnswerCache
+from src.rag.rag_engine import RAGSystem
+from stress_test_rag import tech_queries, noise_queries, is_denied
+
+# Benchmark de latencia, throughput y exactitud del motor RAG con las preguntas de stress_test_rag.py,
+# en proceso (RAGSystem.ask desde N hilos) y por HTTP (la app FastAPI vía httpx.ASGITransport, sin red).
+# Para cada modo reporta arranque en frío, tiempo a la primera respuesta, el scorecard de exactitud y,
+# por nivel de concurrencia, p50/p95/p99, QPS y RSS pico; además, el tiempo de importación del motor y de la
+# API medido en un proceso limpio. Con --baseline compara contra un resultado
+# anterior y termina con código 1 si hay regresiones (latencia, QPS o exactitud).
+
+QUERIES = tech_queries + noise_queries
+
+
+def import_seconds(module):
+    """Import time of a module in a fresh interpreter (this one may have imported it already)."""
+    code = (f"import sys, time; sys.path.append({project_root!r}); start = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - start)")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return round(float(output.strip().splitlines()[-1]), 3)
+
+
+def latency_summary(latencies, elapsed):
+    ms = np.array(latencies) * 1000
+    peak = peak_memory_bytes()
+    return {
+        "requests": len(ms),
+        "qps": round(len(ms) / elapsed, 1),
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        # Process-wide high-water mark: with --mode both, the HTTP figures include the in-process run
+        "peak_rss_mb": round(peak / 2**20, 1) if peak else None,
+    }
+
+
+def scorecard(answers):
+    return {
+        "tech_accuracy": round(sum(not is_denied(answers[q]) for q in tech_queries) / len(tech_queries), 4),
+        "noise_rejection": round(sum(is_denied(answers[q]) for q in noise_queries) / len(noise_queries), 4),
+    }
+
+
+def run_in_process(levels, requests_per_client, answer_cache):
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        rag = RAGSystem(kb_dir='data/raw/kb', answer_cache_size=1024 if answer_cache else 0)
+        rag.index_kb()
+    cold_start = time.perf_counter() - start
+    start = time.perf_counter()
+    rag.ask(QUERIES[0])
+    first_response = time.perf_counter() - start
+    result = {"cold_start_s": round(cold_start, 3), "first_response_s": round(first_response, 3),
+              "accuracy": scorecard({q: rag.ask(q) for q in QUERIES}), "levels": {}}
+
+    def client(offset):
+        latencies = []
+        for i in range(requests_per_client):
+            begin = time.perf_counter()
+            rag.ask(QUERIES[(offset + i) % len(QUERIES)])
+            latencies.append(time.perf_counter() - begin)
+        return latencies
+
+    for clients in levels:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            latencies = [ms for chunk in pool.map(client, range(clients)) for ms in chunk]
+        result["levels"][str(clients)] = latency_summary(latencies, time.perf_counter() - start)
+    return result
+
+
+async def run_http(levels, requests_per_client, answer_cache):
+    from src.api.app import app, ml_models
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+            # The engine loads and warms up in the background: cold start ends when /ready says so
+            while (await http.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.05)
+            cold_start = time.perf_counter() - start
+            if not answer_cache:
+                ml_models["rag"].answer_cache = AnswerCache(max_entries=0)
+            async def ask(question):
+                response = await http.post("/ask", json={"question": question})
+                response.raise_for_status()
+                return response.json()["answer"]
+
+            start = time.perf_counter()
+            await ask(QUERIES[0])
+            first_response = time.perf_counter() - start
+            answers = {q: await ask(q) for q in QUERIES}
+            result = {"cold_start_s": round(cold_start, 3), "first_response_s": round(first_response, 3),
+                      "accuracy": scorecard(answers), "levels": {}}
+
+            async def client(offset, latencies):
+                for i in range(requests_per_client):
+                    begin = time.perf_counter()
+                    await ask(QUERIES[(offset + i) % len(QUERIES)])
+                    latencies.append(time.perf_counter() - begin)
+
+            for clients in levels:
+                latencies = []
+                start = time.perf_counter()
+                await asyncio.gather(*(client(c, latencies) for c in range(clients)))
+                result["levels"][str(clients)] = latency_summary(latencies, time.perf_counter() - start)
+    return result
+
+
+def check_regressions(results, baseline, max_slowdown, min_tech_accuracy, min_noise_rejection):
+    """Human-readable list of regressions against the baseline run and the accuracy floors."""
+    regressions = []
+    for mode, current in results["modes"].items():
+        accuracy = current["accuracy"]
+        if min_tech_accuracy is not None and accuracy["tech_accuracy"] < min_tech_accuracy:
+            regressions.append(f"{mode}: tech_accuracy {accuracy['tech_accuracy']} < {min_tech_accuracy}")
+        if min_noise_rejection is not None and accuracy["noise_rejection"] < min_noise_rejection:
+            regressions.append(f"{mode}: noise_rejection {accuracy['noise_rejection']} < {min_noise_rejection}")
+        previous = (baseline or {}).get("modes", {}).get(mode)
+        if previous is None:
+            continue
+        # Accuracy may not drop at all; speed may vary by max_slowdown
+        for key in ("tech_accuracy", "noise_rejection"):
+            if accuracy[key] < previous["accuracy"][key]:
+                regressions.append(f"{mode}: {key} {accuracy[key]} < baseline {previous['accuracy'][key]}")
+        for clients, level in current["levels"].items():
+            before = previous["levels"].get(clients)
+            if before is None:
+                continue
+            if level["p99_ms"] > before["p99_ms"] * max_slowdown:
+                regressions.append(f"{mode} x{clients}: p99 {level['p99_ms']} ms > baseline {before['p99_ms']} ms "
+                                   f"x {max_slowdown}")
+            if level["qps"] < before["qps"] / max_slowdown:
+                regressions.append(f"{mode} x{clients}: QPS {level['qps']} < baseline {before['qps']} / {max_slowdown}")
+    return regressions
+
+
+def print_report(results):
+    print("\n" + "=" * 80)
+    print(f"RAG SERVICE BENCHMARK ({results['requests_per_client']} requests per client, "
+          f"answer cache {'on' if results['answer_cache'] else 'off'})")
+    print("=" * 80)
+    print("import: " + ", ".join(f"{module} {seconds} s" for module, seconds in results["import_s"].items()))
+    for mode, result in results["modes"].items():
+        accuracy = result["accuracy"]
+        print(f"[{mode}] cold start {result['cold_start_s']} s, first response {result['first_response_s']} s, "
+              f"tech accuracy {accuracy['tech_accuracy']:.0%}, noise rejection {accuracy['noise_rejection']:.0%}")
+        print(f"{'clients':>8}{'QPS':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak RSS MB':>13}")
+        for clients, level in result["levels"].items():
+            print(f"{clients:>8}{level['qps']:>10}{level['p50_ms']:>10}{level['p95_ms']:>10}{level['p99_ms']:>10}"
+                  f"{str(level['peak_rss_mb']):>13}")
+    for regression in results["regressions"]:
+        print(f"REGRESSION: {regression}")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency/throughput/accuracy benchmark of the RAG engine and API")
+    parser.add_argument("--mode", choices=["in-process", "http", "both"], default="both")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=20, help="Requests per client at each concurrency level")
+    parser.add_argument("--answer-cache", action="store_true", help="Keep the answer cache on (off by default)")
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--baseline", help="Results JSON of a previous run to compare against")
+    parser.add_argument("--max-slowdown", type=float, default=1.25,
+                        help="Allowed p99 increase / QPS decrease factor against the baseline")
+    parser.add_argument("--min-tech-accuracy", type=float, help="Fail below this fraction of answered tech queries")
+    parser.add_argument("--min-noise-rejection", type=float, help="Fail below this fraction of rejected noise queries")
+    args = parser.parse_args()
+    # Configured before the app is imported (its basicConfig becomes a no-op): request logs would drown the report
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = {"requests_per_client": args.requests, "answer_cache": args.answer_cache,
+               "import_s": {module: import_seconds(module) for module in ("src.rag.rag_engine", "src.api.app")},
+               "thresholds": {"max_slowdown": args.max_slowdown, "min_tech_accuracy": args.min_tech_accuracy,
+                              "min_noise_rejection": args.min_noise_rejection},
+               "modes": {}}
+    if args.mode in ("in-process", "both"):
+        results["modes"]["in-process"] = run_in_process(args.concurrency, args.requests, args.answer_cache)
+    if args.mode in ("http", "both"):
+        results["modes"]["http"] = asyncio.run(run_http(args.concurrency, args.requests, args.answer_cache))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results["regressions"] = check_regressions(results, baseline, args.max_slowdown, args.min_tech_accuracy,
+                                               args.min_noise_rejection)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+    sys.exit(1 if results["regressions"] else 0)
@@ -28,9 +28,17 @@ with DAG(
     tags=['cala', 'gcp', 'rag'],
 ) as dag:
 
-    def run_pipeline():
-        pipeline = DataPipeline(input_dir='/data/raw', output_dir='/output/processed')
+    def run_pipeline(**context):
+        # Unchanged sources are skipped via the manifest in output_dir; trigger with {"force": true} to rebuild
+        conf = context["dag_run"].conf or {}
+        force = bool(conf.get("force", False))
+        # Hive-partitioned output; {"only_ds": true} rewrites just the fecha_proceso={{ ds }} partition
+        process_date = context["ds"] if conf.get("only_ds") else None
+        pipeline = DataPipeline(input_dir='/data/raw', output_dir='/output/processed', parallel=True, force=force,
+                                partitioned=True, compression='zstd', process_date=process_date)
         pipeline.run()
+        # Per-stage wall time, rows/s and peak RSS, visible in the task's XCom
+        return pipeline.quality_report["performance"]
 
     task_extract_transform = PythonOperator(
         task_id='extract_transform',
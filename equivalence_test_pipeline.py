@@ -0,0 +1,231 @@
+import sys
+import os
+import io
+import json
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+project_root = os.getcwd()
+sys.path.append(project_root)
+from src.pipeline.main import DataPipeline, iter_json_records
+
+OUTPUTS = ["atenciones_cleaned.parquet", "clientes_cleaned.parquet", "eventos_app_cleaned.parquet",
+           "integrity_quarantine.parquet", "kpi_daily.parquet"]
+# Per-stage quality sidecars (one file per stage), compared as a whole
+SIDECARS = ["quality_events", "quality_quarantine"]
+# Row identity used to compare partitioned outputs, whose rows are ordered by partition and clustering keys
+KEYS = {"atenciones_cleaned.parquet": "id_atencion", "clientes_cleaned.parquet": "id_cliente",
+        "eventos_app_cleaned.parquet": "id_evento"}
+
+# Casos borde que no aparecen en los datos de ejemplo
+edge_documents = pd.Series([" 123-45 ", "98765", np.nan, None, 42, "A1B2", "", "00012x"], dtype=object)
+edge_cities = pd.Series(["Bogotá", " medellín ", np.nan, None, "", "CALI", "Cali", "bogotá", "  "], dtype=object)
+edge_states = pd.Series(["activa ", np.nan, "Cerrada", None, "PENDIENTE", "activa "], dtype=object)
+edge_json = pd.Series([
+    '{"diagnostico": "DX1", "medico": "Dr. Gomez"}', '{"diagnostico": "DX2"}', '{"extra": 1}',
+    "{'diagnostico': 'DX3'}", '{"diagnostico": 5}', '["DX4"]', "null", "", "   ", np.nan, None, "{bad",
+], dtype=object)
+
+
+def run_pipeline(input_dir, output_dir, **options):
+    pipeline = DataPipeline(input_dir, output_dir, **options)
+    with redirect_stdout(io.StringIO()):
+        pipeline.run()
+    return pipeline
+
+
+def compare_edge_cases():
+    failures = []
+    ids = pd.Series(range(100, 100 + max(len(edge_documents), len(edge_cities))))
+
+    rowwise, vectorized = DataPipeline("", ""), DataPipeline("", "")
+    expected = edge_documents.to_frame("doc").assign(id=ids).apply(lambda r: rowwise.normalize_document(r["doc"], r["id"], "edge"), axis=1)
+    actual = vectorized.normalize_document_column(edge_documents, ids.iloc[:len(edge_documents)], "edge")
+    if expected.tolist() != actual.tolist():
+        failures.append(f"normalize_document: {expected.tolist()} != {actual.tolist()}")
+
+    expected = edge_cities.to_frame("city").assign(id=ids).apply(lambda r: rowwise.normalize_city(r["city"], r["id"]), axis=1)
+    actual = vectorized.normalize_city_column(edge_cities, ids.iloc[:len(edge_cities)])
+    if expected.tolist() != actual.tolist():
+        failures.append(f"normalize_city: {expected.tolist()} != {actual.tolist()}")
+
+    expected = edge_states.apply(rowwise.normalize_state)
+    actual = vectorized.normalize_state_column(edge_states)
+    if expected.tolist() != actual.tolist():
+        failures.append(f"normalize_state: {expected.tolist()} != {actual.tolist()}")
+
+    ids = pd.Series(range(len(edge_json)))
+    expected = edge_json.to_frame("json").assign(id=ids).apply(lambda r: rowwise.parse_json_detalle(r["json"], r["id"]), axis=1)
+    diagnostico, medico = vectorized.parse_json_detalle_column(edge_json, ids)
+    if [(e["diagnostico"], e["medico"]) for e in expected] != list(zip(diagnostico, medico)):
+        failures.append(f"parse_json_detalle: {expected.tolist()} != {list(zip(diagnostico, medico))}")
+
+    if rowwise.quality_report != vectorized.quality_report:
+        failures.append("quality report differs on edge cases")
+    return failures
+
+
+def compare_json_readers(input_dir, tmp):
+    failures = []
+    with open(os.path.join(input_dir, "eventos_app.json")) as f:
+        expected = json.load(f)
+
+    # Tiny blocks force records to be split across reads
+    if list(iter_json_records(os.path.join(input_dir, "eventos_app.json"), block_size=7)) != expected:
+        failures.append("iter_json_records differs from json.load on the JSON array")
+
+    jsonl_path = os.path.join(tmp, "eventos_app.jsonl")
+    with open(jsonl_path, "w") as f:
+        f.writelines(json.dumps(record) + "\n" for record in expected)
+    if list(iter_json_records(jsonl_path, block_size=64)) != expected:
+        failures.append("iter_json_records differs from json.load on JSON lines")
+    return failures
+
+
+def compare_chunked_text_columns(input_dir, tmp):
+    """
+    A column that is numeric in some chunks (digits and blanks) and text in others must
+    keep the source text in chunked mode, as a whole-file read does.
+    """
+    source = pd.read_csv(os.path.join(input_dir, "atenciones.csv"), dtype=str, keep_default_na=False)
+    source["documento_cliente"] = [str(10_000_000 + i) for i in range(len(source))]
+    source.loc[10, "documento_cliente"] = ""
+    source.loc[len(source) - 10, "documento_cliente"] = "123-456"
+    case_dir = os.path.join(tmp, "mixed_documents")
+    os.makedirs(case_dir)
+    source.to_csv(os.path.join(case_dir, "atenciones.csv"), index=False)
+
+    failures, outputs = [], []
+    for options in [{}, {"chunksize": 700}]:
+        output_dir = os.path.join(case_dir, f"out_{len(outputs)}")
+        os.makedirs(output_dir)
+        pipeline = DataPipeline(case_dir, output_dir, **options)
+        with redirect_stdout(io.StringIO()):
+            pipeline.process_atenciones()
+        outputs.append((pd.read_parquet(os.path.join(output_dir, "atenciones_cleaned.parquet")),
+                        pipeline.quality_report["summary"]["cleanups_document"]))
+    try:
+        pd.testing.assert_frame_equal(outputs[0][0], outputs[1][0])
+    except AssertionError as e:
+        failures.append(f"atenciones_cleaned.parquet: {e}")
+    if outputs[0][1] != outputs[1][1]:
+        failures.append(f"cleanups_document: {outputs[0][1]} != {outputs[1][1]}")
+    return failures
+
+
+def compare_partitioned_rerun(input_dir, tmp, reference_dir):
+    """A full partitioned rewrite drops partitions that no longer have rows (and their KPIs)."""
+    output_dir = os.path.join(tmp, "partitioned_rerun")
+    os.makedirs(output_dir)
+    run_pipeline(input_dir, output_dir, partitioned=True)
+    for table in ["atenciones_cleaned", "eventos_app_cleaned"]:
+        # Partición de una fecha que ya no está en la fuente
+        root = os.path.join(output_dir, table)
+        partition = sorted(name for name in os.listdir(root) if name.startswith("fecha_proceso="))[0]
+        shutil.copytree(os.path.join(root, partition), os.path.join(root, "fecha_proceso=1999-01-01"))
+    run_pipeline(input_dir, output_dir, partitioned=True, force=True)
+    return compare_outputs(reference_dir, output_dir)
+
+
+def as_text(df):
+    """Typed (arrow) outputs hold the same values with other dtypes: compare their text form."""
+    df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.DatetimeTZDtype):
+            values = values.dt.tz_convert(None)
+        values = values.astype(object)
+        df[col] = values.where(values.notna(), None).map(str)
+    return df
+
+
+def compare_outputs(reference_dir, candidate_dir, typed=False):
+    failures = []
+    for name in OUTPUTS:
+        reference = pd.read_parquet(os.path.join(reference_dir, name))
+        partitioned_dir = os.path.join(candidate_dir, name.replace(".parquet", ""))
+        if os.path.isdir(partitioned_dir):
+            candidate = pd.read_parquet(partitioned_dir)
+            # The partition column comes back from the directory names
+            reference["fecha_proceso"] = reference["fecha_proceso"].astype(str)
+            candidate["fecha_proceso"] = candidate["fecha_proceso"].astype(str)
+            reference = reference.sort_values(KEYS[name]).reset_index(drop=True)
+            candidate = candidate.sort_values(KEYS[name]).reset_index(drop=True)[reference.columns]
+        else:
+            candidate = pd.read_parquet(os.path.join(candidate_dir, name))
+        if typed:
+            reference, candidate = as_text(reference), as_text(candidate)
+        try:
+            pd.testing.assert_frame_equal(reference, candidate)
+        except AssertionError as e:
+            failures.append(f"{name}: {e}")
+
+    for name in SIDECARS:
+        # Dictionary-encoded columns: compare the values, not the dictionaries
+        reference = as_text(pd.read_parquet(os.path.join(reference_dir, name)))
+        candidate = as_text(pd.read_parquet(os.path.join(candidate_dir, name)))
+        try:
+            pd.testing.assert_frame_equal(reference, candidate)
+        except AssertionError as e:
+            failures.append(f"{name}: {e}")
+
+    with open(os.path.join(reference_dir, "quality_report.json")) as f:
+        reference_report = json.load(f)
+    with open(os.path.join(candidate_dir, "quality_report.json")) as f:
+        candidate_report = json.load(f)
+    for section in ["summary", "details", "events"]:
+        if reference_report[section] != candidate_report[section]:
+            failures.append(f"quality_report.json: '{section}' differs")
+    return failures
+
+
+def run_equivalence_test(input_dir="data/raw"):
+    print("=" * 80)
+    print("PIPELINE EQUIVALENCE TEST (row-wise reference vs optimized paths)")
+    print("=" * 80)
+
+    results = {"edge cases (normalize_*, parse_json_detalle)": compare_edge_cases()}
+    with tempfile.TemporaryDirectory() as tmp:
+        results["iter_json_records (array, JSON lines)"] = compare_json_readers(input_dir, tmp)
+        results["chunked mixed-type columns"] = compare_chunked_text_columns(input_dir, tmp)
+        reference_dir = os.path.join(tmp, "rowwise")
+        os.makedirs(reference_dir)
+        run_pipeline(input_dir, reference_dir, vectorized=False)
+
+        candidates = {
+            "vectorized": {"vectorized": True},
+            "vectorized + chunked/streaming": {"vectorized": True, "chunksize": 700},
+            "rowwise + chunked/streaming": {"vectorized": False, "chunksize": 4096},
+            "vectorized + parallel stages": {"vectorized": True, "parallel": True},
+            "partitioned output": {"partitioned": True, "compression": "zstd"},
+            "partitioned + chunked/streaming": {"partitioned": True, "chunksize": 1500, "row_group_size": 100},
+            "arrow backend + typed schemas": {"arrow": True},
+            "arrow + chunked/streaming": {"arrow": True, "chunksize": 900},
+            "arrow + partitioned + chunked/streaming": {"arrow": True, "partitioned": True, "chunksize": 2500},
+        }
+        for label, options in candidates.items():
+            candidate_dir = os.path.join(tmp, label)
+            os.makedirs(candidate_dir)
+            run_pipeline(input_dir, candidate_dir, **options)
+            results[label] = compare_outputs(reference_dir, candidate_dir, typed=options.get("arrow", False))
+        results["partitioned rerun (stale partitions)"] = compare_partitioned_rerun(input_dir, tmp, reference_dir)
+
+    passed = 0
+    for label, failures in results.items():
+        print(f"{label}: {'PASS' if not failures else 'FAIL'}")
+        for failure in failures:
+            print(f"  {failure}")
+        passed += not failures
+
+    print("=" * 80)
+    print(f"Equivalent paths: {passed}/{len(results)}")
+    print("=" * 80)
+    return passed == len(results)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if run_equivalence_test() else 1)
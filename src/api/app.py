@@ -1,5 +1,9 @@
 import sys
 import os
+import time
+
+# Startup reference: /ready reports import, load and first-response times relative to it
+STARTED = time.perf_counter()
 
 # DLL Stability Patch for Windows
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
@@ -12,78 +16,268 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append(project_root)
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import pandas as pd
-import time
+import asyncio
+import logging
 from contextlib import asynccontextmanager
-from typing import Dict, Any
+from datetime import date
+from typing import Dict, Any, List, Optional
+
+from pydantic import Field
 
+from src.api.batching import MicroBatcher, Overloaded
+from src.api.kpis import KPIStore
+from src.api.metrics import CONTENT_TYPE, CallbackMetric, Histogram, Registry, peak_memory_bytes, resident_memory_bytes
+from src.rag.answer_cache import AnswerCache
 from src.rag.rag_engine import RAGSystem
 
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+# Inference admission control: worker threads, waiting questions before 429, and seconds before 504
+INFERENCE_WORKERS = int(os.environ.get("RAG_INFERENCE_WORKERS", "1"))
+INFERENCE_MAX_QUEUE = int(os.environ.get("RAG_MAX_QUEUE", "256"))
+INFERENCE_TIMEOUT = float(os.environ.get("RAG_REQUEST_TIMEOUT", "10"))
+# Seconds between checks for a newly published index snapshot (0 disables hot reload)
+RELOAD_INTERVAL = float(os.environ.get("RAG_RELOAD_INTERVAL", "30"))
+# Answered once per loaded index before it serves, so the first real /ask does not pay for the first
+# forward passes (kernel selection, buffer allocation) and first spaCy calls
+WARMUP_QUESTIONS = [
+    "¿Qué es un código CUPS?",
+    "¿Cuál es la arquitectura propuesta en GCP para el pipeline?",
+    "¿Cómo se calcula la tasa de error de calidad de datos?",
+    "¿Cuál es la receta de la pizza?",
+]
+
 # Global state for the RAG engine
 ml_models = {}
+# Seconds since STARTED (import, ready, first_response) and durations (load, warmup); see /ready
+startup = {}
+kpi_store = KPIStore("output/processed")
+
+# Prometheus metrics served by /metrics
+metrics = Registry()
+request_latency = metrics.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status")))
+rag_stage_latency = metrics.register(Histogram(
+    "rag_stage_duration_seconds", "RAGSystem.ask stage latency (embed/search per batch, the rest per question)",
+    ("stage",)))
+
+def rag_metric(read):
+    return lambda: read(ml_models["rag"]) if "rag" in ml_models else None
+
+def batcher_metric(key):
+    return lambda: ml_models["batcher"].stats()[key] if "batcher" in ml_models else None
+
+for metric in [
+    CallbackMetric("rag_index_vectors", "Vectors in the FAISS index", rag_metric(lambda rag: rag.index.ntotal)),
+    CallbackMetric("rag_chunks", "Indexed KB chunks", rag_metric(lambda rag: len(rag.metadata))),
+    CallbackMetric("rag_embeddings_bytes", "Size of the chunk embeddings", rag_metric(lambda rag: rag.embeddings.nbytes)),
+    CallbackMetric("rag_answer_cache_entries", "Cached answers", rag_metric(lambda rag: rag.answer_cache.stats()["entries"])),
+    CallbackMetric("rag_answer_cache_hits_total", "Answer cache hits by layer", rag_metric(lambda rag: {
+        ("exact",): rag.answer_cache.stats()["exact_hits"], ("semantic",): rag.answer_cache.stats()["semantic_hits"]}),
+        "counter", ("layer",)),
+    CallbackMetric("rag_answer_cache_misses_total", "Answer cache misses",
+                   rag_metric(lambda rag: rag.answer_cache.stats()["misses"]), "counter"),
+    CallbackMetric("rag_inference_queue_depth", "Questions waiting for an inference worker", batcher_metric("queued")),
+    CallbackMetric("rag_inference_batches_in_flight", "Batches being answered", batcher_metric("in_flight_batches")),
+    CallbackMetric("rag_inference_rejected_total", "Requests rejected with 429", batcher_metric("rejected"), "counter"),
+    CallbackMetric("rag_inference_timeouts_total", "Requests that missed their deadline (504)",
+                   batcher_metric("timed_out"), "counter"),
+    CallbackMetric("api_startup_seconds", "API startup: import, load, warmup and ready/first response since import",
+                   lambda: {(phase[:-len("_seconds")],): seconds for phase, seconds in startup.items()
+                           if phase.endswith("_seconds")},
+                   labelnames=("phase",)),
+    CallbackMetric("process_resident_memory_bytes", "Resident memory", resident_memory_bytes),
+    CallbackMetric("process_peak_resident_memory_bytes", "Peak resident memory", peak_memory_bytes),
+]:
+    metrics.register(metric)
+
+def observe_rag_stages(timings):
+    for stage, seconds in timings.items():
+        rag_stage_latency.observe(seconds, stage)
+
+def warm_up(rag):
+    """Answers WARMUP_QUESTIONS one by one and as a batch, leaving the answer cache and metrics untouched."""
+    answer_cache, on_timings = rag.answer_cache, rag.on_timings
+    rag.answer_cache, rag.on_timings = AnswerCache(max_entries=0), None
+    try:
+        for question in WARMUP_QUESTIONS:
+            rag.ask(question)
+        rag.ask_batch(WARMUP_QUESTIONS)
+    finally:
+        rag.answer_cache, rag.on_timings = answer_cache, on_timings
+
+def load_rag():
+    # Preloaded (models and memory-mapped index) by src/api/serve.py before forking the workers
+    rag = ml_models.get("rag")
+    if rag is None:
+        logger.info("Loading NLP models and building index...")
+        kb_path = "data/raw/kb"
+        rag = RAGSystem(kb_dir=kb_path)
+        rag.index_kb()
+    return rag
+
+async def start_rag():
+    """Loads and warms the RAG engine in the background; /ask answers 503 and /ready is false until it is done."""
+    loop = asyncio.get_running_loop()
+    try:
+        start = time.perf_counter()
+        rag = await loop.run_in_executor(None, load_rag)
+        startup["load_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        await loop.run_in_executor(None, warm_up, rag)
+        startup["warmup_seconds"] = time.perf_counter() - start
+    except Exception as e:
+        logger.exception("Could not load the RAG engine")
+        startup["error"] = str(e)
+        return
+    rag.on_timings = observe_rag_stages
+    ml_models["rag"] = rag
+    # Concurrent /ask requests are embedded and searched together (see src/api/batching.py)
+    batcher = MicroBatcher(rag.ask_batch, workers=INFERENCE_WORKERS, max_queue=INFERENCE_MAX_QUEUE,
+                           timeout=INFERENCE_TIMEOUT)
+    await batcher.start()
+    ml_models["batcher"] = batcher
+    startup["ready_seconds"] = time.perf_counter() - STARTED
+    logger.info("RAG engine ready in %.2fs (load %.2fs, warm-up %.2fs).",
+                startup["ready_seconds"], startup["load_seconds"], startup["warmup_seconds"])
+    if RELOAD_INTERVAL > 0:
+        await watch_index()
+
+async def watch_index():
+    """Swaps in a newly published index snapshot (e.g. from `python -m src.api.serve --build-only`) without a restart."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(RELOAD_INTERVAL)
+        try:
+            rag = await loop.run_in_executor(None, ml_models["rag"].reloaded)
+            if rag is not None:
+                await loop.run_in_executor(None, warm_up, rag)
+        except Exception:
+            logger.exception("Could not load the new index snapshot; still serving %s", ml_models["rag"].snapshot)
+            continue
+        if rag is not None:
+            # Batches already running finish on the previous instance
+            ml_models["rag"] = rag
+            ml_models["batcher"].handler = rag.ask_batch
+            logger.info("Serving index snapshot %s", rag.snapshot)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialize RAG System on startup
-    print("Loading NLP models and building index...")
-    kb_path = "data/raw/kb"
-    rag = RAGSystem(kb_dir=kb_path)
-    rag.load_and_chunk()
-    rag.build_index()
-    ml_models["rag"] = rag
-    print("API is ready to accept requests.")
+    # /health, /kpis and /metrics are served while the models load
+    loader = asyncio.create_task(start_rag())
+    logger.info("API is accepting requests; loading the RAG engine in the background.")
     yield
     # Clean up on shutdown
+    loader.cancel()
+    await asyncio.gather(loader, return_exceptions=True)
+    if "batcher" in ml_models:
+        await ml_models["batcher"].stop()
     ml_models.clear()
-    print("Models unloaded.")
+    logger.info("Models unloaded.")
 
 app = FastAPI(title="CALA Analytics API", lifespan=lifespan)
 
 @app.middleware("http")
 async def log_requests(request, call_next):
-    if request.method == "POST":
-        print(f"Incoming POST to {request.url.path}")
-    return await call_next(request)
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start_time
+        # Route template (e.g. /ask/batch), so unknown paths cannot blow up the label set
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        request_latency.observe(elapsed, request.method, route, str(status))
+        logger.debug("%s %s -> %d in %.4fs", request.method, request.url.path, status, elapsed)
 
 class QueryRequest(BaseModel):
     question: str
 
+class BatchQueryRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=256)
+
+# Async so it runs on the event loop: neither inference threads nor the threadpool can hold it up
 @app.get("/health")
-def health_check():
-    return {"status": "healthy", "timestamp": time.time()}
+async def health_check():
+    # Liveness: the process answers; whether /ask can be served is /ready
+    health = {"status": "healthy", "ready": "batcher" in ml_models, "timestamp": time.time()}
+    if "rag" in ml_models:
+        # Hit/miss counters of the /ask answer cache
+        health["answer_cache"] = ml_models["rag"].answer_cache.stats()
+    if "batcher" in ml_models:
+        health["inference"] = ml_models["batcher"].stats()
+    return health
+
+@app.get("/ready")
+async def readiness_check():
+    """200 once the RAG engine is loaded and warmed up, 503 before (or if loading failed)."""
+    ready = "batcher" in ml_models
+    body = {"ready": ready, "startup": startup}
+    if ready:
+        body["snapshot"] = ml_models["rag"].snapshot
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
 
 @app.get("/kpis")
-def get_kpis():
+def get_kpis(request: Request, desde: Optional[date] = None, hasta: Optional[date] = None,
+             canal: Optional[str] = None, estado: Optional[str] = None):
     try:
-        # For simplicity in this local test, we read from the cleaned parquet
-        df = pd.read_parquet("output/processed/atenciones_cleaned.parquet")
-        kpis = {
-            "total_atenciones": int(len(df)),
-            "total_facturado": float(df['valor_facturado'].sum()),
-            "promedio_facturado": float(df['valor_facturado'].mean()),
-            "top_canales": df['canal_ingreso'].value_counts().to_dict()
-        }
-        return kpis
+        etag, kpis = kpi_store.get(desde.isoformat() if desde else None, hasta.isoformat() if hasta else None,
+                                   canal, estado)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    # Polling clients revalidate with If-None-Match and get an empty 304 while the data is unchanged
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(kpis, headers=headers)
 
-@app.post("/ask")
-def ask_rag(request: QueryRequest) -> Dict[str, Any]:
-    start_time = time.time()
+async def run_inference(questions: List[str]) -> List[str]:
+    if "batcher" not in ml_models:
+        if "error" in startup:
+            raise HTTPException(status_code=503, detail=f"RAG Model could not be loaded: {startup['error']}")
+        raise HTTPException(status_code=503, detail="RAG Model is not loaded yet.", headers={"Retry-After": "5"})
     try:
-        if "rag" not in ml_models:
-            raise HTTPException(status_code=503, detail="RAG Model is not loaded yet.")
-        
-        answer = ml_models["rag"].ask(request.question)
-        latency = time.time() - start_time
-        return {
-            "answer": answer,
-            "latency_seconds": round(latency, 4)
-        }
+        answers = await ml_models["batcher"].submit_many(questions)
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"No answer within {INFERENCE_TIMEOUT}s.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    startup.setdefault("first_response_seconds", time.perf_counter() - STARTED)
+    return answers
+
+@app.post("/ask")
+async def ask_rag(request: QueryRequest) -> Dict[str, Any]:
+    start_time = time.time()
+    answer, = await run_inference([request.question])
+    latency = time.time() - start_time
+    return {
+        "answer": answer,
+        "latency_seconds": round(latency, 4)
+    }
+
+@app.post("/ask/batch")
+async def ask_rag_batch(request: BatchQueryRequest) -> Dict[str, Any]:
+    start_time = time.time()
+    answers = await run_inference(request.questions)
+    latency = time.time() - start_time
+    return {
+        "answers": answers,
+        "latency_seconds": round(latency, 4)
+    }
+
+startup["import_seconds"] = time.perf_counter() - STARTED
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,155 @@
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+# Weight of the latest batch in the moving average of seconds per item (used for Retry-After)
+EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """The queue cannot take the request; retry_after is the estimated wait in seconds until it drains."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Inference queue is full, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching for the event loop: items submitted concurrently are
+    gathered for up to max_wait_ms (or until max_batch_size arrive) and handed to
+    `handler(items) -> results` in one call, on a dedicated pool of `workers`
+    inference threads (the event loop and Starlette's threadpool never run the
+    model). While every worker is busy, new items queue up and form the next
+    batches, so batches grow with the load.
+
+    Admission control: at most max_queue items wait; beyond that submit raises
+    Overloaded. Each submission has a deadline (`timeout` seconds): when it
+    passes, submit raises asyncio.TimeoutError and its items are dropped from
+    the queue before any work is done for them.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, workers: int = 1, max_queue: int = 256,
+                 timeout: Optional[float] = None):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self.slots: Optional[asyncio.Semaphore] = None
+        self.task: Optional[asyncio.Task] = None
+        self.running = set()
+        self.seconds_per_item = 0.0
+        self.rejected = self.timed_out = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-inference")
+
+    async def start(self):
+        # Unbounded on its own: submit_many admits a request only if all its items fit in max_queue
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.workers)
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        tasks = [task for task in [self.task, *self.running] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = None
+        while self.queue is not None and not self.queue.empty():
+            fail([self.queue.get_nowait()], RuntimeError("Batcher stopped"))
+        self.executor.shutdown(wait=False)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.queue.qsize() * self.seconds_per_item / self.workers))
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "in_flight_batches": len(self.running),
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    async def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        return (await self.submit_many([item], timeout))[0]
+
+    async def submit_many(self, items: List[Any], timeout: Optional[float] = None) -> List[Any]:
+        """Queues the items individually (they may land in different batches) and waits for all results."""
+        if self.queue.qsize() + len(items) > self.max_queue:
+            self.rejected += 1
+            raise Overloaded(self.retry_after())
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in items]
+        for item, future in zip(items, futures):
+            self.queue.put_nowait((item, future))
+        try:
+            # On timeout the futures are cancelled, which takes them out of any batch not yet started
+            return list(await asyncio.wait_for(asyncio.gather(*futures), timeout or self.timeout))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+
+    async def next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Requests that timed out or whose client went away are dropped before any work is done for them
+        return [(item, future) for item, future in batch if not future.done()]
+
+    async def run(self):
+        while True:
+            # A batch is gathered only once a worker is free to run it
+            await self.slots.acquire()
+            try:
+                batch = await self.next_batch()
+            except asyncio.CancelledError:
+                self.slots.release()
+                raise
+            if not batch:
+                self.slots.release()
+                continue
+            task = asyncio.create_task(self.process(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def process(self, batch):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        try:
+            results = await loop.run_in_executor(self.executor, self.handler, [item for item, _ in batch])
+        except asyncio.CancelledError:
+            fail(batch, RuntimeError("Batcher stopped"))
+            raise
+        except Exception as e:
+            fail(batch, e)
+            return
+        finally:
+            self.slots.release()
+        elapsed = (loop.time() - start) / len(batch)
+        self.seconds_per_item += EWMA_ALPHA * (elapsed - self.seconds_per_item)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+def fail(batch, error: Exception):
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
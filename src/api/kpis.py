@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from src.pipeline.kpis import KPI_COLUMNS, KPI_TABLE, aggregate_kpis, read_kpi_table
+from src.pipeline.manifest import listing_sha256
+from src.pipeline.writers import cleaned_output_path
+
+
+class KPIStore:
+    """
+    Serves /kpis from the daily KPI aggregates (kpi_daily.parquet written by the
+    pipeline, or built from the projected columns of the cleaned atenciones, a
+    single file or a partitioned directory, when it is missing or was written by
+    an older pipeline). The aggregates are reloaded only when the source's size/mtime
+    changes, and each filter combination is answered once per source version.
+    """
+
+    def __init__(self, output_dir: str, max_entries: int = 256):
+        self.output_dir = output_dir
+        self.kpi_path = os.path.join(output_dir, KPI_TABLE)
+        self.max_entries = max_entries
+        self.version: Optional[str] = None
+        self.daily: Optional[pd.DataFrame] = None
+        self.responses: "OrderedDict[Tuple, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def atenciones_path(self) -> str:
+        """The pipeline's cleaned atenciones: the partitioned directory if there is one, else the single file."""
+        path = cleaned_output_path(self.output_dir, "atenciones", partitioned=True)
+        return path if os.path.isdir(path) else cleaned_output_path(self.output_dir, "atenciones", partitioned=False)
+
+    def source_version(self) -> Tuple[str, str]:
+        path = self.kpi_path if os.path.exists(self.kpi_path) else self.atenciones_path()
+        if os.path.isdir(path):
+            # Partitioned atenciones: a partition can be swapped without touching the root mtime
+            return path, f"{path}:{listing_sha256(path)}"
+        stat = os.stat(path)
+        return path, f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def load(self, path: str) -> pd.DataFrame:
+        if path == self.kpi_path:
+            daily, state = read_kpi_table(path)
+            if state:
+                return daily
+            # Stale table: served from the cleaned atenciones until the pipeline rewrites it
+            path = self.atenciones_path()
+        return aggregate_kpis([pd.read_parquet(path, columns=KPI_COLUMNS)])
+
+    def get(self, desde: Optional[str] = None, hasta: Optional[str] = None, canal: Optional[str] = None,
+            estado: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """Returns (ETag, KPIs) for the filters; the ETag only changes with the source version."""
+        path, version = self.source_version()
+        key = (desde, hasta, canal, estado.upper() if estado else None)
+        with self.lock:
+            if version != self.version:
+                self.daily = self.load(path)
+                self.version = version
+                self.responses.clear()
+            if key in self.responses:
+                self.responses.move_to_end(key)
+                return self.responses[key]
+            daily = self.daily
+
+        etag = '"' + hashlib.sha256(json.dumps([version, *key]).encode()).hexdigest()[:32] + '"'
+        response = (etag, compute_kpis(daily, *key))
+        with self.lock:
+            if version == self.version:
+                self.responses[key] = response
+                while len(self.responses) > self.max_entries:
+                    self.responses.popitem(last=False)
+        return response
+
+
+def compute_kpis(daily: pd.DataFrame, desde: Optional[str] = None, hasta: Optional[str] = None,
+                 canal: Optional[str] = None, estado: Optional[str] = None) -> Dict[str, Any]:
+    """Same payload /kpis always returned, computed from the daily aggregates instead of raw rows."""
+    mask = pd.Series(True, index=daily.index)
+    if desde:
+        mask &= daily["fecha_proceso"] >= desde
+    if hasta:
+        mask &= daily["fecha_proceso"] <= hasta
+    if canal:
+        mask &= daily["canal_ingreso"] == canal
+    if estado:
+        mask &= daily["estado"] == estado
+    selected = daily[mask]
+    total_atenciones = int(selected["total_atenciones"].sum())
+    atenciones_facturadas = int(selected["atenciones_facturadas"].sum())
+    total_facturado = round(float(selected["total_facturado"].sum()), 2)
+    top_canales = selected.groupby("canal_ingreso", dropna=True, observed=True)["total_atenciones"].sum()
+    top_canales = top_canales[top_canales > 0].sort_values(ascending=False, kind="stable")
+    return {
+        "total_atenciones": total_atenciones,
+        "total_facturado": total_facturado,
+        # Mean over the atenciones with a valor_facturado, as pandas' mean() skips nulls
+        "promedio_facturado": total_facturado / atenciones_facturadas if atenciones_facturadas else None,
+        "top_canales": {str(k): int(v) for k, v in top_canales.items()},
+    }
@@ -0,0 +1,85 @@
+import sys
+import os
+
+# Add project root to path for local imports
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+import argparse
+import logging
+import multiprocessing
+import signal
+
+import uvicorn
+
+from src.api import app as api
+from src.rag.rag_engine import RAGSystem
+
+logger = logging.getLogger(__name__)
+
+KB_DIR = "data/raw/kb"
+
+
+def build_index(kb_dir):
+    logging.basicConfig(level=logging.INFO)
+    RAGSystem(kb_dir=kb_dir).index_kb()
+
+
+def fork_workers(config, sock, workers):
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+        pids.append(pid)
+    return pids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork server: one index build, N workers sharing models and index")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--kb-dir", default=KB_DIR)
+    parser.add_argument("--build-only", action="store_true",
+                        help="Build and publish the index snapshot, then exit; running workers hot-reload it")
+    args = parser.parse_args()
+
+    # The index is built (and the model run) in a spawned process: a process that has run
+    # torch inference cannot safely fork, and this one forks the workers
+    builder = multiprocessing.get_context("spawn").Process(target=build_index, args=(args.kb_dir,))
+    builder.start()
+    builder.join()
+    if builder.exitcode != 0:
+        sys.exit(builder.exitcode)
+    if args.build_only:
+        return
+
+    # Loaded before forking, so the workers share the model weights copy-on-write and the
+    # memory-mapped snapshot through the page cache
+    rag = RAGSystem(kb_dir=args.kb_dir)
+    if not rag.load_index():
+        sys.exit("No index snapshot to serve")
+    api.ml_models["rag"] = rag
+
+    config = uvicorn.Config(api.app, host=args.host, port=args.port)
+    sock = config.bind_socket()
+    pids = fork_workers(config, sock, args.workers)
+    logger.info("Started %d workers: %s", len(pids), pids)
+
+    def stop(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    main()
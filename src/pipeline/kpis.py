@@ -0,0 +1,85 @@
+import json
+import os
+from typing import Any, Dict, Iterable, Set, Tuple
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.pipeline.schemas import KPI_DAILY_SCHEMA, to_arrow_table
+
+# Grain of the daily KPIs in src/modeling/bigquery_queries.sql
+KPI_KEYS = ["fecha_proceso", "canal_ingreso", "estado"]
+KPI_COLUMNS = KPI_KEYS + ["valor_facturado"]
+KPI_TABLE = "kpi_daily.parquet"
+# Parquet key-value metadata holding the source fingerprints the table was computed from
+STATE_KEY = b"cala.kpi_sources"
+
+
+def aggregate_kpis(batches: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """COUNT(*), COUNT(valor_facturado) and SUM(valor_facturado) by KPI_KEYS, folding per-batch partial aggregates."""
+    partials = []
+    for batch in batches:
+        keys = [batch[key].astype(object).where(batch[key].notna(), None).map(str, na_action="ignore") for key in KPI_KEYS]
+        partials.append(batch["valor_facturado"].astype("float64").groupby(keys, dropna=False)
+                        .agg(["size", "count", "sum"]))
+    if not partials:
+        return pd.DataFrame({key: pd.Series(dtype=object) for key in KPI_KEYS}
+                            | {"total_atenciones": pd.Series(dtype="int64"), "atenciones_facturadas": pd.Series(dtype="int64"),
+                               "total_facturado": pd.Series(dtype="float64")})
+    totals = pd.concat(partials).groupby(level=[0, 1, 2], dropna=False).sum()
+    totals.index.names = KPI_KEYS
+    kpis = totals.rename(columns={"size": "total_atenciones", "count": "atenciones_facturadas",
+                                  "sum": "total_facturado"}).reset_index()
+    # valor_facturado has cents: rounding keeps sums independent of batch boundaries and order
+    kpis["total_facturado"] = kpis["total_facturado"].round(2)
+    kpis[["total_atenciones", "atenciones_facturadas"]] = kpis[["total_atenciones", "atenciones_facturadas"]].astype("int64")
+    return kpis
+
+
+def merge_kpis(target: pd.DataFrame, source: pd.DataFrame, dates: Set[Any]) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    MERGE of the recomputed `source` rows into `target`, scoped to `dates`:
+    matched keys are updated, unmatched source keys inserted, and target keys of
+    those dates that are no longer in the source deleted (BigQuery's
+    `WHEN NOT MATCHED BY SOURCE AND fecha_proceso IN dates THEN DELETE`).
+    Rows of every other date are left as they are.
+    """
+    target_keys = pd.MultiIndex.from_frame(target[KPI_KEYS])
+    source_keys = pd.MultiIndex.from_frame(source[KPI_KEYS])
+    in_scope = target["fecha_proceso"].isin(dates).to_numpy()
+    matched = target_keys.isin(source_keys)
+    stats = {
+        "updated": int(matched.sum()),
+        "inserted": int((~source_keys.isin(target_keys)).sum()),
+        "deleted": int((in_scope & ~matched).sum()),
+    }
+    merged = pd.concat([target[~in_scope], source], ignore_index=True)
+    merged = merged.sort_values(KPI_KEYS, kind="stable", na_position="first").reset_index(drop=True)
+    return merged, stats
+
+
+def read_kpi_table(path: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    The current KPI table (dates as YYYY-MM-DD text) and the source state it was
+    built from. A missing table, or one written without every KPI_DAILY_SCHEMA
+    column, is returned empty with no state, so all of its dates are recomputed.
+    """
+    if not os.path.exists(path) or not set(KPI_DAILY_SCHEMA.names) <= set(pq.read_schema(path).names):
+        return aggregate_kpis([]), {}
+    table = pq.read_table(path)
+    state = json.loads((table.schema.metadata or {}).get(STATE_KEY, b"{}"))
+    df = table.to_pandas()
+    df["fecha_proceso"] = df["fecha_proceso"].astype(object).where(df["fecha_proceso"].notna(), None) \
+        .map(str, na_action="ignore")
+    for key in KPI_KEYS[1:]:
+        df[key] = df[key].astype(object)
+    return df, state
+
+
+def write_kpi_table(path: str, df: pd.DataFrame, state: Dict[str, Any], compression: str = "snappy") -> None:
+    """Replaces the KPI table atomically, storing `state` in its footer."""
+    table = to_arrow_table(df, KPI_DAILY_SCHEMA)
+    table = table.replace_schema_metadata({STATE_KEY: json.dumps(state, sort_keys=True).encode()})
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression=compression, write_statistics=True)
+    os.replace(tmp_path, path)
@@ -3,15 +3,50 @@ import json
 import os
 import re
 import argparse
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import unicodedata
-from typing import Dict, Any, Optional
-from pydantic import BaseModel, Field, ValidationError
+from typing import Annotated, Dict, Any, List, Optional, Tuple, Union
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pandas.tseries.api import guess_datetime_format
+from pydantic import BaseModel, Field, Json, TypeAdapter, ValidationError
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Add project root to path for local imports
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+from src.pipeline.kpis import KPI_COLUMNS, KPI_TABLE, aggregate_kpis, merge_kpis, read_kpi_table, write_kpi_table
+from src.pipeline.manifest import Manifest, fingerprint, listing_sha256, sources_sha256
+from src.pipeline.quality import SAMPLE_SIZE, RecordSink
+from src.pipeline.schemas import (INTEGRITY_QUARANTINE_SCHEMA, QUALITY_EVENTS_SCHEMA, QUALITY_QUARANTINE_SCHEMA,
+                                  TABLE_SCHEMAS, low_cardinality_columns)
+from src.pipeline.writers import DEFAULT_PARTITION, ParquetFileSink, PartitionedParquetSink, cleaned_output_path
+
+ARROW_STRING = pd.ArrowDtype(pa.string())
 
 class JsonDetalle(BaseModel):
     diagnostico: Optional[str] = Field(default=None)
     medico: Optional[str] = Field(default=None)
 
+# Parses and validates a whole json_detalle column in a single pydantic-core call.
+# Rows that are not valid JSON objects fall through to the raw string so they can be
+# re-parsed individually (keeping the exact ERROR_JSON/ERROR_VALIDATION messages).
+JsonDetalleBatch = TypeAdapter(
+    List[Annotated[Union[Json[JsonDetalle], str], Field(union_mode='left_to_right')]]
+)
+JSON_BATCH_ROWS = 100_000
+
 def remove_accents(input_str: Any) -> Optional[str]:
     if pd.isna(input_str) or not input_str:
         return None
@@ -19,33 +54,340 @@ def remove_accents(input_str: Any) -> Optional[str]:
     return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
 
 
+def iter_json_records(path: str, block_size: int = 1 << 20):
+    """
+    Yields the records of a JSON array or of a JSON-lines file one at a time,
+    reading the file in blocks so memory does not grow with its size.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer, pos, eof = "", 0, False
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,[':
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    return
+                buffer, pos = f.read(block_size), 0
+                eof = not buffer
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The record is split across blocks: keep the tail and read more
+                chunk = f.read(block_size)
+                if not chunk:
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield record
+            pos = end
+
+
+def iter_batches(records, batch_size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Any change to the pipeline code (this module, writers, schemas, quality, kpis...) invalidates the
+# stages recorded in the manifest
+CODE_VERSION = sources_sha256(os.path.dirname(os.path.abspath(__file__)))[:16]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the current process, in MB (None where unsupported)."""
+    try:
+        # Linux: VmHWM is per address space, so unlike ru_maxrss it is not inherited across exec
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak RSS to the current RSS (Linux: "5" to /proc/self/clear_refs resets VmHWM),
+    so peak_rss_mb() then measures from here. False where the peak cannot be reset. This is
+    process-wide: whatever else reads the process' peak afterwards sees the reset value.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _run_stage(pipeline: "DataPipeline", stage: str, own_process: bool = False) -> Dict[str, Any]:
+    """Process pool entry point: runs one stage and returns its quality-report fragment."""
+    pipeline.run_stage(stage, own_process)
+    return pipeline.quality_report
+
+
+def _common_dtype(left, right):
+    """dtype pandas would infer for a column whose chunks were inferred as left and right."""
+    if left == right:
+        return left
+    if isinstance(left, pd.ArrowDtype) or isinstance(right, pd.ArrowDtype):
+        if pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right) \
+                and not pd.api.types.is_bool_dtype(left) and not pd.api.types.is_bool_dtype(right):
+            floating = pd.api.types.is_float_dtype(left) or pd.api.types.is_float_dtype(right)
+            return pd.ArrowDtype(pa.float64() if floating else pa.int64())
+        return ARROW_STRING
+    if pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right) \
+            and not pd.api.types.is_bool_dtype(left) and not pd.api.types.is_bool_dtype(right):
+        return np.result_type(left, right)
+    return np.dtype(object)
+
+
+def _arrow_type(dtype) -> pa.DataType:
+    if isinstance(dtype, pd.ArrowDtype):
+        return dtype.pyarrow_dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return pa.bool_()
+    if pd.api.types.is_integer_dtype(dtype):
+        return pa.int64()
+    if pd.api.types.is_float_dtype(dtype):
+        return pa.float64()
+    return pa.string()
+
+
+def _conform_chunk(chunk: pd.DataFrame, dtypes: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Casts a CSV chunk to the dtypes inferred for the whole file. Object columns are
+    not cast: they are read as text (see process_atenciones_chunked), since a chunk
+    inferred as float would turn 43604200 into "43604200.0".
+    """
+    chunk = chunk.copy()
+    for col, dtype in dtypes.items():
+        if dtype != object and chunk[col].dtype != dtype:
+            chunk[col] = chunk[col].astype(dtype)
+    return chunk
+
+
+def _categorical_from_codes(mapped: np.ndarray, codes: np.ndarray, index: pd.Index) -> pd.Series:
+    """Categorical Series of mapped[codes] built without materializing one string per row."""
+    categories, inverse = np.unique(mapped.astype(str), return_inverse=True)
+    return pd.Series(pd.Categorical.from_codes(inverse[codes], categories), index=index)
+
+
+def _client_keys(values: pd.Series) -> pd.Series:
+    """id_cliente as nullable Int64: eventos carry it as text, clientes/atenciones as integers."""
+    return pd.to_numeric(values, errors="coerce").astype("Int64")
+
+
+def _latest_per_id(ids: np.ndarray, dates: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Keeps, per id, the latest date and on ties the earliest row. Output is sorted by id."""
+    order = np.lexsort((-rows, dates, ids))
+    ids, dates, rows = ids[order], dates[order], rows[order]
+    last = np.append(ids[1:] != ids[:-1], True) if len(ids) else np.empty(0, dtype=bool)
+    return ids[last], dates[last], rows[last]
+
+
 class DataPipeline:
-    def __init__(self, input_dir, output_dir):
+    STAGES = ("atenciones", "clientes", "eventos")
+    # Stages that read the cleaned outputs of STAGES, run once those are written
+    DEPENDENT_STAGES = ("integrity", "kpis")
+    # Tables checked against clientes: (record id column, document column or None)
+    INTEGRITY_SOURCES = {
+        "atenciones": ("id_atencion", "documento_cliente"),
+        "eventos": ("id_evento", None),
+    }
+    # Partitioned output mirrors fct_atenciones: PARTITION BY fecha_proceso, CLUSTER BY id_cliente, codigo_cups
+    PARTITION_COLUMN = "fecha_proceso"
+    CLUSTER_KEYS = {
+        "atenciones": ["id_cliente", "codigo_cups"],
+        "eventos": ["id_cliente", "timestamp"],
+    }
+
+    def __init__(self, input_dir, output_dir, vectorized: bool = True, chunksize: Optional[int] = None,
+                 parallel: bool = False, force: bool = False, partitioned: bool = False,
+                 compression: str = "snappy", row_group_size: Optional[int] = None,
+                 process_date: Optional[str] = None, arrow: bool = False):
         self.input_dir = input_dir
         self.output_dir = output_dir
+        # Column-wide normalization (True) or the original row-by-row path (False)
+        self.vectorized = vectorized
+        # Rows per chunk for bounded-memory atenciones/eventos ingestion (None = load whole files)
+        self.chunksize = chunksize
+        # Run the independent stages in a process pool
+        self.parallel = parallel
+        # Re-run every stage even if its inputs match the manifest
+        self.force = force
+        # Hive-partitioned output (fecha_proceso=YYYY-MM-DD/) sorted by CLUSTER_KEYS
+        self.partitioned = partitioned
+        self.compression = compression
+        self.row_group_size = row_group_size
+        # With partitioned output, only rewrite this fecha_proceso (Airflow's {{ ds }})
+        self.process_date = process_date
+        # pyarrow dtype backend from read to write, categorical low-cardinality columns and the
+        # explicit BigQuery-aligned schemas in schemas.py
+        self.arrow = arrow
+        self.stage_rows: Dict[str, Tuple[int, int]] = {}
         self.quality_report = {
             "summary": {
                 "critical_errors": 0,
                 "cleanups_document": 0,
                 "cleanups_city": 0,
-                "duplicates_removed": 0
+                "duplicates_removed": 0,
+                "orphans_atenciones": 0,
+                "orphans_eventos": 0,
+                "document_mismatches": 0
             },
             "details": {
                 "critical_errors": [],
                 "cleanups_document": [],
-                "cleanups_city": []
+                "cleanups_city": [],
+                "integrity": []
+            },
+            # Event count per stage and rule; the events are in quality_events/<stage>.parquet (integrity
+            # findings in integrity_quarantine.parquet)
+            "events": {},
+            "performance": {
+                "mode": "parallel" if parallel else "sequential",
+                "stages": {}
             }
         }
+        # Opened by run_stage for the stage being run (see quality_outputs)
+        self.quality_events = RecordSink(QUALITY_EVENTS_SCHEMA)
+        self.quality_quarantine = RecordSink(QUALITY_QUARANTINE_SCHEMA)
+
+    def count_events(self, stage: str, rule: str, count: int) -> None:
+        rules = self.quality_report["events"].setdefault(stage, {})
+        rules[rule] = rules.get(rule, 0) + int(count)
 
-    def log_critical(self, message: str) -> None:
+    def log_critical(self, stage: str, rule: str, record_id: Any, original: str, cleaned: str, error: str) -> None:
+        """A rejected source value: counted, sampled, recorded as an event and quarantined."""
         self.quality_report["summary"]["critical_errors"] += 1
-        self.quality_report["details"]["critical_errors"].append(message)
+        self.count_events(stage, rule, 1)
+        details = self.quality_report["details"]["critical_errors"]
+        if len(details) < SAMPLE_SIZE:
+            details.append({"record_id": str(record_id), "stage": stage, "rule": rule, "original": original,
+                            "cleaned": cleaned, "error": error})
+        self.quality_events.append(stage, rule, record_id, original, cleaned)
+        self.quality_quarantine.append(stage, rule, record_id, original, error)
 
-    def log_cleanup(self, category: str, message: str) -> None:
+    def log_cleanup(self, category: str, stage: str, rule: str, record_id: Any, original: str, cleaned: str) -> None:
         self.quality_report["summary"][f"cleanups_{category}"] += 1
-        # Limit details to first 500 to keep report size manageable
-        if len(self.quality_report["details"][f"cleanups_{category}"]) < 500:
-            self.quality_report["details"][f"cleanups_{category}"].append(message)
+        self.count_events(stage, rule, 1)
+        details = self.quality_report["details"][f"cleanups_{category}"]
+        if len(details) < SAMPLE_SIZE:
+            details.append({"record_id": str(record_id), "stage": stage, "rule": rule, "original": original,
+                            "cleaned": cleaned})
+        self.quality_events.append(stage, rule, record_id, original, cleaned)
+
+    def spawn(self) -> "DataPipeline":
+        """Pipeline with the same configuration and an empty quality report, to run a single stage."""
+        return DataPipeline(self.input_dir, self.output_dir, vectorized=self.vectorized, chunksize=self.chunksize,
+                            parallel=self.parallel, force=self.force, partitioned=self.partitioned,
+                            compression=self.compression, row_group_size=self.row_group_size,
+                            process_date=self.process_date, arrow=self.arrow)
+
+    def quality_outputs(self, stage: str) -> List[str]:
+        """Per-stage sidecars, so parallel workers and stages skipped by the manifest keep their own files."""
+        if stage not in self.STAGES:
+            return []
+        return [os.path.join(self.output_dir, "quality_events", f"{stage}.parquet"),
+                os.path.join(self.output_dir, "quality_quarantine", f"{stage}.parquet")]
+
+    def stage_inputs(self, stage: str) -> List[str]:
+        if stage == "eventos":
+            return [self.eventos_path()]
+        if stage == "kpis":
+            return self.stage_outputs("atenciones")
+        if stage == "integrity":
+            return [path for source in ("clientes", *self.INTEGRITY_SOURCES) for path in self.stage_outputs(source)]
+        return [os.path.join(self.input_dir, f"{stage}.csv")]
+
+    def stage_outputs(self, stage: str) -> List[str]:
+        if stage == "integrity":
+            return [os.path.join(self.output_dir, "integrity_quarantine.parquet")]
+        if stage == "kpis":
+            return [os.path.join(self.output_dir, KPI_TABLE)]
+        name = "eventos_app" if stage == "eventos" else stage
+        return [cleaned_output_path(self.output_dir, name, self.partitioned and stage in self.CLUSTER_KEYS)]
+
+    def open_output(self, stage: str):
+        """Sink for a stage's cleaned rows: a single parquet file or a Hive-partitioned directory."""
+        path = self.stage_outputs(stage)[0]
+        schema = TABLE_SCHEMAS[stage] if self.arrow else None
+        if self.partitioned and stage in self.CLUSTER_KEYS:
+            return PartitionedParquetSink(path, self.PARTITION_COLUMN, self.CLUSTER_KEYS[stage],
+                                          compression=self.compression, row_group_size=self.row_group_size,
+                                          only=self.process_date, schema=schema)
+        return ParquetFileSink(path, compression=self.compression, row_group_size=self.row_group_size,
+                               schema=schema)
+
+    def read_csv(self, path: str, **kwargs) -> pd.DataFrame:
+        if not self.arrow:
+            return pd.read_csv(path, **kwargs)
+        # The multithreaded pyarrow parser does not support chunked reads
+        engine = "c" if kwargs.get("chunksize") else "pyarrow"
+        return pd.read_csv(path, engine=engine, dtype_backend="pyarrow", **kwargs)
+
+    def read_output(self, stage: str, columns: List[str], filter: Optional[ds.Expression] = None):
+        """Streams columns of a stage's cleaned output (single file or partitioned directory) as DataFrames."""
+        dataset = ds.dataset(self.stage_outputs(stage)[0], format="parquet", partitioning="hive")
+        for batch in dataset.to_batches(columns=columns, filter=filter):
+            yield batch.to_pandas()
+
+    def to_categorical(self, df: pd.DataFrame, stage: str) -> pd.DataFrame:
+        """In arrow mode, keeps the schema's low-cardinality string columns as categoricals in memory."""
+        if self.arrow:
+            for col in low_cardinality_columns(TABLE_SCHEMAS[stage]):
+                if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].astype("category")
+        return df
+
+    def code_version(self) -> str:
+        # Options that change the written files are part of the version
+        return (f"{CODE_VERSION}:vectorized={self.vectorized}:chunksize={self.chunksize}"
+                f":partitioned={self.partitioned}:compression={self.compression}"
+                f":row_group_size={self.row_group_size}:process_date={self.process_date}:arrow={self.arrow}")
+
+    def record_rows(self, stage: str, rows_in: int, rows_out: int) -> None:
+        self.stage_rows[stage] = (int(rows_in), int(rows_out))
+
+    def merge_quality_report(self, fragment: Dict[str, Any]) -> None:
+        """Folds the report of a stage run elsewhere (e.g. a worker process) into this one."""
+        for key, value in fragment["summary"].items():
+            self.quality_report["summary"][key] += value
+        for key, records in fragment["details"].items():
+            details = self.quality_report["details"][key]
+            details.extend(records[:max(0, SAMPLE_SIZE - len(details))])
+        for stage, rules in fragment.get("events", {}).items():
+            for rule, count in rules.items():
+                self.count_events(stage, rule, count)
+        self.quality_report["performance"]["stages"].update(fragment["performance"]["stages"])
+
+    def log_cleanups(self, category: str, stage: str, rule: str, record_ids, originals, cleaned) -> None:
+        """Bulk variant of log_cleanup over aligned arrays: only the records that fit in the sample become dicts."""
+        count = len(record_ids)
+        self.quality_report["summary"][f"cleanups_{category}"] += count
+        if not count:
+            return
+        self.count_events(stage, rule, count)
+        details = self.quality_report["details"][f"cleanups_{category}"]
+        remaining = SAMPLE_SIZE - len(details)
+        if remaining > 0:
+            details.extend({"record_id": str(i), "stage": stage, "rule": rule, "original": o, "cleaned": c}
+                           for i, o, c in zip(*(list(values[:remaining]) for values in (record_ids, originals, cleaned))))
+        self.quality_events.extend(stage, rule, record_ids, originals, cleaned)
 
     def normalize_document(self, doc: Any, record_id: Any, category: str = "general") -> Optional[str]:
         if pd.isna(doc):
@@ -53,7 +395,7 @@ class DataPipeline:
         original = str(doc)
         cleaned = re.sub(r'\D', '', original)
         if original != cleaned:
-            self.log_cleanup("document", f"ID {record_id} ({category}) - Cleaned '{original}' to '{cleaned}'")
+            self.log_cleanup("document", category, "document_non_digits", record_id, original, cleaned)
         return cleaned
 
     def normalize_state(self, state: Any) -> str:
@@ -70,9 +412,55 @@ class DataPipeline:
         clean = clean_name.strip().title() if clean_name else "Desconocido"
         
         if original != clean:
-            self.log_cleanup("city", f"ID {record_id} - Cleaned '{original}' to '{clean}'")
+            self.log_cleanup("city", "clientes", "city_normalized", record_id, original, clean)
         return clean
 
+    def normalize_document_column(self, docs: pd.Series, record_ids: pd.Series, category: str = "general") -> pd.Series:
+        """Vectorized equivalent of normalize_document over a whole column."""
+        present = docs.notna()
+        if isinstance(docs.dtype, pd.ArrowDtype):
+            # pyarrow compute (RE2); \P{Nd} is RE2's spelling of Python's Unicode-aware \D
+            original = docs.astype(ARROW_STRING)
+            cleaned = original.str.replace(r'\P{Nd}', '', regex=True)
+            changed = present & (original != cleaned).fillna(False)
+        else:
+            original = docs.astype(str)
+            cleaned = original.str.replace(r'\D', '', regex=True)
+            changed = present & (original != cleaned)
+
+        changed = changed.to_numpy(dtype=bool)
+        self.log_cleanups("document", category, "document_non_digits", record_ids.to_numpy()[changed],
+                          original.array[changed], cleaned.array[changed])
+        if isinstance(cleaned.dtype, pd.ArrowDtype):
+            return cleaned
+        return cleaned.astype(object).where(present, None)
+
+    def normalize_state_column(self, states: pd.Series) -> pd.Series:
+        """Vectorized equivalent of normalize_state, evaluated once per distinct value."""
+        codes, uniques = pd.factorize(states)
+        mapped = pd.Series([self.normalize_state(v) for v in uniques] + ["DESCONOCIDO"], dtype=object)
+        if self.arrow:
+            return _categorical_from_codes(mapped.to_numpy(), codes, states.index)
+        return pd.Series(mapped.to_numpy()[codes], index=states.index, dtype=object)
+
+    def normalize_city_column(self, cities: pd.Series, record_ids: pd.Series) -> pd.Series:
+        """Vectorized equivalent of normalize_city, evaluated once per distinct value."""
+        codes, uniques = pd.factorize(cities)
+        clean_uniques = []
+        for city in uniques:
+            clean_name = remove_accents(city)
+            clean_uniques.append(clean_name.strip().title() if clean_name else "Desconocido")
+        # Missing cities (code -1) map to the trailing "Desconocido" and are never logged
+        mapped = pd.Series(clean_uniques + ["Desconocido"], dtype=object).to_numpy()
+        originals = np.array([str(o) for o in uniques] + [None], dtype=object)
+        changed_uniques = pd.Series([str(o) != c for o, c in zip(uniques, clean_uniques)] + [False]).to_numpy()
+        positions = changed_uniques[codes].nonzero()[0]
+        self.log_cleanups("city", "clientes", "city_normalized", record_ids.to_numpy()[positions],
+                          originals[codes[positions]], mapped[codes[positions]])
+        if self.arrow:
+            return _categorical_from_codes(mapped, codes, cities.index)
+        return pd.Series(mapped[codes], index=cities.index, dtype=object)
+
     def parse_json_detalle(self, json_str: Any, record_id: Any) -> Dict[str, Optional[str]]:
         try:
             if pd.isna(json_str) or not str(json_str).strip():
@@ -82,14 +470,65 @@ class DataPipeline:
             validated_data = JsonDetalle(**data)
             return validated_data.model_dump()
         except ValidationError as e:
-            self.log_critical(f"ID {record_id} - Pydantic Validation Error: {e.errors()[0]['msg']}")
+            self.log_critical("atenciones", "json_validation", record_id, str(json_str), "ERROR_VALIDATION",
+                              f"Pydantic Validation Error: {e.errors()[0]['msg']}")
             return {"diagnostico": "ERROR_VALIDATION", "medico": "ERROR_VALIDATION"}
         except Exception as e:
-            self.log_critical(f"ID {record_id} - Error parsing JSON: {str(e)}")
+            self.log_critical("atenciones", "json_parse", record_id, str(json_str), "ERROR_JSON",
+                              f"Error parsing JSON: {str(e)}")
             return {"diagnostico": "ERROR_JSON", "medico": "ERROR_JSON"}
 
+    def parse_json_detalle_column(self, values: pd.Series, record_ids: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+        """Batched equivalent of parse_json_detalle. Returns (diagnostico, medico) arrays."""
+        diagnostico = np.full(len(values), None, dtype=object)
+        medico = np.full(len(values), None, dtype=object)
+
+        text = values.astype(str)
+        present = (values.notna() & (text.str.strip() != '')).to_numpy()
+        text = text.to_numpy()
+        invalid = []
+        # Validated models are short-lived: parse in slices so they never all exist at once
+        for block in np.array_split(present.nonzero()[0], max(1, -(-int(present.sum()) // JSON_BATCH_ROWS))):
+            parsed = JsonDetalleBatch.validate_python(text[block].tolist())
+            valid = np.fromiter((isinstance(item, JsonDetalle) for item in parsed), dtype=bool, count=len(parsed))
+            valid_items = [item for item, ok in zip(parsed, valid) if ok]
+            diagnostico[block[valid]] = [item.diagnostico for item in valid_items]
+            medico[block[valid]] = [item.medico for item in valid_items]
+            invalid.append(block[~valid])
+
+        # Malformed rows go through the row-wise parser, in row order, for identical logging
+        ids = record_ids.to_numpy()
+        for pos in np.concatenate(invalid):
+            fields = self.parse_json_detalle(values.iat[pos], ids[pos])
+            diagnostico[pos], medico[pos] = fields["diagnostico"], fields["medico"]
+        return diagnostico, medico
+
+    def clean_atenciones(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Normalization and JSON parsing for already deduplicated atenciones."""
+        df = df.reset_index(drop=True)
+
+        # Normalization
+        if self.vectorized:
+            df['documento_cliente'] = self.normalize_document_column(df['documento_cliente'], df['id_atencion'], "atenciones")
+            df['estado'] = self.normalize_state_column(df['estado'])
+        else:
+            df['documento_cliente'] = df.apply(lambda r: self.normalize_document(r['documento_cliente'], r['id_atencion'], "atenciones"), axis=1)
+            df['estado'] = df['estado'].apply(self.normalize_state)
+        
+        # Parse JSON
+        if self.vectorized:
+            df['diagnostico'], df['medico'] = self.parse_json_detalle_column(df['json_detalle'], df['id_atencion'])
+        else:
+            json_fields = df.apply(lambda row: self.parse_json_detalle(row['json_detalle'], row['id_atencion']), axis=1)
+            df_json = pd.json_normalize(json_fields)
+            df = pd.concat([df, df_json], axis=1)
+        return self.to_categorical(df, "atenciones")
+
     def process_atenciones(self):
-        df = pd.read_csv(os.path.join(self.input_dir, "atenciones.csv"))
+        if self.chunksize:
+            return self.process_atenciones_chunked()
+
+        df = self.read_csv(os.path.join(self.input_dir, "atenciones.csv"))
         initial_count = len(df)
         
         # Deduplication: Keep latest fecha_atencion for same id_atencion
@@ -98,70 +537,395 @@ class DataPipeline:
         df = df.drop_duplicates(subset=['id_atencion'], keep='first')
         
         self.quality_report["summary"]["duplicates_removed"] = initial_count - len(df)
+        self.record_rows("atenciones", initial_count, len(df))
 
-        # Normalization
-        df['documento_cliente'] = df.apply(lambda r: self.normalize_document(r['documento_cliente'], r['id_atencion'], "atenciones"), axis=1)
-        df['estado'] = df['estado'].apply(self.normalize_state)
-        
-        # Parse JSON
-        json_fields = df.apply(lambda row: self.parse_json_detalle(row['json_detalle'], row['id_atencion']), axis=1)
-        df_json = pd.json_normalize(json_fields)
-        df = pd.concat([df.reset_index(drop=True), df_json], axis=1)
+        df = self.clean_atenciones(df)
         
         # Export
-        output_path = os.path.join(self.output_dir, "atenciones_cleaned.parquet")
-        df.drop(columns=['json_detalle']).to_parquet(output_path, index=False)
+        with self.open_output("atenciones") as sink:
+            sink.write(df.drop(columns=['json_detalle']))
         return df
 
+    def process_atenciones_chunked(self) -> None:
+        """
+        Bounded-memory variant of process_atenciones, producing the same parquet and
+        duplicates_removed. Memory depends on chunksize plus a compact
+        (id_atencion, fecha_atencion, row) index, not on the width of the file.
+
+        1. Stream the CSV once to find the winning row per id_atencion (latest
+           fecha_atencion, first occurrence on ties) and the dtype each column
+           would get if the file were read at once.
+        2. Stream it again, range-partitioning the winning rows by id_atencion
+           into parquet spill files of ~chunksize rows.
+        3. Clean each partition in id order and append it as a row group.
+        """
+        input_path = os.path.join(self.input_dir, "atenciones.csv")
+        reader = lambda **kwargs: self.read_csv(input_path, chunksize=self.chunksize, **kwargs)
+
+        # Pass 1: winners index. Each chunk is reduced to its own winners, and those are reduced once
+        # at the end, rather than re-sorting the winners so far with every chunk
+        chunk_winners = []
+        dtypes: Dict[str, Any] = {}
+        date_format = None
+        total_rows = 0
+        for chunk in reader():
+            if date_format is None and chunk['fecha_atencion'].notna().any():
+                date_format = guess_datetime_format(str(chunk['fecha_atencion'].dropna().iloc[0]))
+            for col, dtype in chunk.dtypes.items():
+                dtypes[col] = dtype if col not in dtypes else _common_dtype(dtypes[col], dtype)
+
+            dates = pd.to_datetime(chunk['fecha_atencion'], format=date_format)
+            # NaT is stored as int64 min, so it only wins when every record of an id is NaT
+            chunk_winners.append(_latest_per_id(
+                chunk['id_atencion'].to_numpy(dtype=np.int64),
+                dates.to_numpy(dtype='datetime64[ns]', na_value=np.datetime64('NaT')).view(np.int64),
+                np.arange(total_rows, total_rows + len(chunk)),
+            ))
+            total_rows += len(chunk)
+        if chunk_winners:
+            win_ids, win_dates, win_rows = _latest_per_id(*map(np.concatenate, zip(*chunk_winners)))
+        else:
+            win_ids = win_dates = win_rows = np.empty(0, dtype=np.int64)
+        del chunk_winners
+
+        self.quality_report["summary"]["duplicates_removed"] = total_rows - len(win_ids)
+        self.record_rows("atenciones", total_rows, len(win_ids))
+
+        keep = np.zeros(total_rows, dtype=bool)
+        keep[win_rows] = True
+        # win_ids is sorted, so every chunksize-th id starts a new partition
+        boundaries = win_ids[::self.chunksize]
+        spill_schema = pa.schema([(col, _arrow_type(dtype)) for col, dtype in dtypes.items()])
+
+        with tempfile.TemporaryDirectory(dir=self.output_dir) as spill_dir:
+            # Pass 2: range-partition the winning rows
+            spill_writers: Dict[int, pq.ParquetWriter] = {}
+            offset = 0
+            # Columns a whole-file read types as object hold the source text, as that read would
+            text_columns = {col: str for col, dtype in dtypes.items() if dtype == object}
+            for chunk in reader(dtype=text_columns):
+                winners = keep[offset:offset + len(chunk)]
+                offset += len(chunk)
+                chunk = _conform_chunk(chunk[winners], dtypes)
+                partitions = np.searchsorted(boundaries, chunk['id_atencion'].to_numpy(), side='right') - 1
+                for partition in np.unique(partitions):
+                    if partition not in spill_writers:
+                        spill_path = os.path.join(spill_dir, f"partition_{partition:06d}.parquet")
+                        spill_writers[partition] = pq.ParquetWriter(spill_path, spill_schema)
+                    part = chunk[partitions == partition]
+                    spill_writers[partition].write_table(pa.Table.from_pandas(part, schema=spill_schema, preserve_index=False))
+            for writer in spill_writers.values():
+                writer.close()
+
+            # Pass 3: clean partitions in id order and append them as row groups
+            with self.open_output("atenciones") as sink:
+                for partition in sorted(spill_writers):
+                    table = pq.read_table(os.path.join(spill_dir, f"partition_{partition:06d}.parquet"))
+                    df = table.to_pandas(types_mapper=pd.ArrowDtype if self.arrow else None)
+                    df = df.sort_values(by='id_atencion', kind='stable')
+                    df['fecha_atencion'] = pd.to_datetime(df['fecha_atencion'], format=date_format)
+                    sink.write(self.clean_atenciones(df).drop(columns=['json_detalle']))
+        return None
+
     def process_clientes(self):
-        df = pd.read_csv(os.path.join(self.input_dir, "clientes.csv"))
+        df = self.read_csv(os.path.join(self.input_dir, "clientes.csv"))
         
         # Normalization
-        df['documento'] = df.apply(lambda r: self.normalize_document(r['documento'], r['id_cliente'], "clientes"), axis=1)
-        df['segmento'] = df['segmento'].str.upper()
-        df['ciudad'] = df.apply(lambda r: self.normalize_city(r['ciudad'], r['id_cliente']), axis=1)
+        if self.vectorized:
+            df['documento'] = self.normalize_document_column(df['documento'], df['id_cliente'], "clientes")
+            df['segmento'] = df['segmento'].str.upper()
+            df['ciudad'] = self.normalize_city_column(df['ciudad'], df['id_cliente'])
+        else:
+            df['documento'] = df.apply(lambda r: self.normalize_document(r['documento'], r['id_cliente'], "clientes"), axis=1)
+            df['segmento'] = df['segmento'].str.upper()
+            df['ciudad'] = df.apply(lambda r: self.normalize_city(r['ciudad'], r['id_cliente']), axis=1)
+        df = self.to_categorical(df, "clientes")
         
+        self.record_rows("clientes", len(df), len(df))
+
         # Export
-        output_path = os.path.join(self.output_dir, "clientes_cleaned.parquet")
-        df.to_parquet(output_path, index=False)
+        with self.open_output("clientes") as sink:
+            sink.write(df)
         return df
 
-    def process_eventos(self):
-        with open(os.path.join(self.input_dir, "eventos_app.json"), 'r') as f:
-            data = json.load(f)
-        df = pd.DataFrame(data)
-        
+    def eventos_path(self) -> str:
+        """eventos_app.json (JSON array) or, once the app team switches, eventos_app.jsonl."""
+        path = os.path.join(self.input_dir, "eventos_app.json")
+        if not os.path.exists(path) and os.path.exists(path + "l"):
+            return path + "l"
+        return path
+
+    def clean_eventos(self, df: pd.DataFrame) -> pd.DataFrame:
+        # Flatten metadata.ip so it can be loaded as a plain column
+        if 'metadata' in df.columns:
+            if isinstance(df['metadata'].dtype, pd.ArrowDtype):
+                df['metadata_ip'] = df['metadata'].struct.field('ip')
+            else:
+                df['metadata_ip'] = [m.get('ip') if isinstance(m, dict) else None for m in df['metadata']]
+            df = df.drop(columns=['metadata'])
+
         # Normalization: Ensure id_cliente is numeric/clean if it was a string
         # and convert timestamps to datetime
         if 'id_cliente' in df.columns:
-            df['id_cliente'] = df.apply(lambda r: self.normalize_document(r['id_cliente'], r.get('id_evento', 'N/A'), "eventos"), axis=1)
+            if self.vectorized:
+                record_ids = df['id_evento'] if 'id_evento' in df.columns else pd.Series('N/A', index=df.index)
+                df['id_cliente'] = self.normalize_document_column(df['id_cliente'], record_ids, "eventos")
+            else:
+                df['id_cliente'] = df.apply(lambda r: self.normalize_document(r['id_cliente'], r.get('id_evento', 'N/A'), "eventos"), axis=1)
         
         if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+            # Source mixes second and microsecond precision timestamps
+            df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
             df['fecha_proceso'] = df['timestamp'].dt.date
+        return self.to_categorical(df, "eventos")
+
+    def records_frame(self, records: List[Dict[str, Any]]) -> pd.DataFrame:
+        if self.arrow:
+            return pa.Table.from_pylist(records).to_pandas(types_mapper=pd.ArrowDtype)
+        return pd.DataFrame(records)
+
+    def process_eventos(self):
+        if self.chunksize:
+            return self.process_eventos_streaming()
+
+        path = self.eventos_path()
+        if path.endswith(".jsonl"):
+            data = list(iter_json_records(path))
+        else:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        df = self.records_frame(data)
+        df = self.clean_eventos(df)
+        self.record_rows("eventos", len(df), len(df))
             
         # Export
-        output_path = os.path.join(self.output_dir, "eventos_app_cleaned.parquet")
-        df.to_parquet(output_path, index=False)
+        with self.open_output("eventos") as sink:
+            sink.write(df)
         return df
 
+    def process_eventos_streaming(self) -> None:
+        """Parses, cleans and writes eventos in batches of chunksize records (one row group each)."""
+        rows = 0
+        with self.open_output("eventos") as sink:
+            for batch in iter_batches(iter_json_records(self.eventos_path()), self.chunksize):
+                df = self.clean_eventos(self.records_frame(batch))
+                rows += len(df)
+                sink.write(df)
+        self.record_rows("eventos", rows, rows)
+        return None
+
+    def process_integrity(self) -> pd.DataFrame:
+        """
+        Semi-joins the cleaned atenciones and eventos against clientes through hash
+        indexes on id_cliente and (id_cliente, documento), one batch at a time.
+        Orphans and document mismatches are reported and quarantined; the cleaned
+        outputs themselves are left as written.
+        """
+        print("Checking referential integrity...")
+        clientes = pd.concat(list(self.read_output("clientes", ["id_cliente", "documento"])), ignore_index=True)
+        client_ids = _client_keys(clientes["id_cliente"])
+        client_docs = clientes["documento"].astype(object)
+        known_ids = pd.Index(client_ids.dropna().unique())
+        known_pairs = pd.MultiIndex.from_arrays([client_ids, client_docs])
+        # A duplicated client keeps every document as valid; the first one is reported as expected
+        expected_docs = client_docs.set_axis(client_ids)
+        expected_docs = expected_docs[~expected_docs.index.duplicated()]
+
+        flagged, rows_in = [], 0
+        for source, (id_column, doc_column) in self.INTEGRITY_SOURCES.items():
+            columns = [id_column, "id_cliente"] + ([doc_column] if doc_column else [])
+            for batch in self.read_output(source, columns):
+                rows_in += len(batch)
+                ids = _client_keys(batch["id_cliente"])
+                orphan = ~ids.isin(known_ids).to_numpy()
+                docs = batch[doc_column].astype(object) if doc_column else pd.Series(None, index=batch.index, dtype=object)
+                mismatch = np.zeros(len(batch), dtype=bool)
+                checked = ~orphan & docs.notna().to_numpy()
+                if doc_column and checked.any():
+                    pairs = pd.MultiIndex.from_arrays([ids[checked], docs[checked]])
+                    mismatch[checked] = ~pairs.isin(known_pairs)
+                bad = orphan | mismatch
+                if not bad.any():
+                    continue
+                flagged.append(pd.DataFrame({
+                    "tabla": source,
+                    "id_registro": batch[id_column].to_numpy()[bad].astype("int64"),
+                    "id_cliente": ids[bad].array,
+                    "documento": docs[bad].to_numpy(),
+                    "documento_esperado": ids[bad].map(expected_docs).astype(object).to_numpy(),
+                    "motivo": np.where(orphan[bad], "orphan", "document_mismatch"),
+                }))
+
+        columns = INTEGRITY_QUARANTINE_SCHEMA.names
+        quarantine = pd.concat(flagged, ignore_index=True) if flagged else pd.DataFrame(columns=columns)
+        # Only flagged rows are sorted, so the report and file do not depend on the output layout
+        quarantine = quarantine.sort_values(["tabla", "id_registro"], kind="stable").reset_index(drop=True)
+        for source in self.INTEGRITY_SOURCES:
+            self.quality_report["summary"][f"orphans_{source}"] += int(
+                ((quarantine["tabla"] == source) & (quarantine["motivo"] == "orphan")).sum())
+        self.quality_report["summary"]["document_mismatches"] += int((quarantine["motivo"] == "document_mismatch").sum())
+        for (source, motivo), count in quarantine.groupby(["tabla", "motivo"], observed=True).size().items():
+            self.count_events(source, motivo, count)
+        details = self.quality_report["details"]["integrity"]
+        # Through JSON so numpy integers and missing values become plain numbers and nulls
+        details.extend(json.loads(quarantine.head(max(0, SAMPLE_SIZE - len(details))).to_json(orient="records")))
+
+        with ParquetFileSink(self.stage_outputs("integrity")[0], compression=self.compression,
+                             row_group_size=self.row_group_size, schema=INTEGRITY_QUARANTINE_SCHEMA) as sink:
+            sink.write(quarantine)
+        self.record_rows("integrity", rows_in, len(quarantine))
+        return quarantine
+
+    def kpi_source_state(self) -> Dict[str, str]:
+        """Fingerprint per fecha_proceso partition of the cleaned atenciones, or one ("*") for a single file."""
+        path = self.stage_outputs("atenciones")[0]
+        if not os.path.isdir(path):
+            return {"*": fingerprint(path)["sha256"]}
+        prefix = f"{self.PARTITION_COLUMN}="
+        return {name[len(prefix):]: listing_sha256(os.path.join(path, name))
+                for name in sorted(os.listdir(path)) if name.startswith(prefix)}
+
+    def process_kpis(self) -> pd.DataFrame:
+        """
+        Upserts kpi_daily.parquet (row count, count and sum of valor_facturado by fecha_proceso,
+        canal_ingreso and estado) from the cleaned atenciones. Only the dates whose
+        partition changed since the last build are read and re-aggregated; a single
+        output file changes as a whole, so all of its dates are.
+        """
+        print("Updating daily KPIs...")
+        kpi_path = self.stage_outputs("kpis")[0]
+        target, previous = read_kpi_table(kpi_path)
+        current = self.kpi_source_state()
+        if "*" in current or "*" in previous:
+            source = aggregate_kpis(self.read_output("atenciones", KPI_COLUMNS))
+            dates = set(target["fecha_proceso"]) | set(source["fecha_proceso"])
+        else:
+            changed = {value for value in current.keys() | previous.keys() if current.get(value) != previous.get(value)}
+            dates = {None if value == DEFAULT_PARTITION else value for value in changed}
+            column = ds.field(self.PARTITION_COLUMN)
+            filter = column.isin(sorted(date for date in dates if date is not None))
+            if None in dates:
+                filter = filter | column.is_null()
+            source = aggregate_kpis(self.read_output("atenciones", KPI_COLUMNS, filter) if dates else [])
+
+        merged, stats = merge_kpis(target, source, dates)
+        write_kpi_table(kpi_path, merged, current, compression=self.compression)
+        print(f"  {len(dates)} dates recomputed: {stats['updated']} updated, {stats['inserted']} inserted, "
+              f"{stats['deleted']} deleted")
+        self.record_rows("kpis", source["total_atenciones"].sum(), len(merged))
+        return merged
+
+    def run_stage(self, stage: str, own_process: bool = False) -> None:
+        """
+        Runs process_<stage> and records its wall time, row counts and peak RSS.
+        Only a stage that runs in its own process (a pool worker) resets the
+        process' peak RSS to measure its own; in the caller's process (e.g. an
+        Airflow task) the peak is left alone, and the stage's peak is known only
+        when it raised the process peak.
+        """
+        process_peak = peak_rss_mb()
+        reset = own_process and reset_peak_rss()
+        start = time.perf_counter()
+        sinks = list(zip((self.quality_events, self.quality_quarantine), self.quality_outputs(stage)))
+        for sink, path in sinks:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            sink.open(path, compression=self.compression)
+        try:
+            getattr(self, f"process_{stage}")()
+        finally:
+            for sink, _ in sinks:
+                sink.close()
+        elapsed = time.perf_counter() - start
+        peak = peak_rss_mb()
+        raised = peak is not None and process_peak is not None and peak > process_peak
+        peaks = [value for value in (process_peak, peak) if value is not None]
+        rows_in, rows_out = self.stage_rows.get(stage, (0, 0))
+        self.quality_report["performance"]["stages"][stage] = {
+            "wall_seconds": round(elapsed, 3),
+            "rows_in": rows_in,
+            "rows_out": rows_out,
+            "rows_per_second": round(rows_in / elapsed, 1) if elapsed > 0 else None,
+            "peak_rss_mb": peak if reset or raised else None,
+            "process_peak_rss_mb": max(peaks) if peaks else None,
+        }
+
+    def run_stages(self, stages, manifest: Manifest, code_version: str) -> None:
+        """Runs the stages whose manifest entry is stale (in a process pool if parallel) and merges their reports."""
+        pending = [
+            stage for stage in stages
+            if self.force or not manifest.is_current(stage, self.stage_inputs(stage),
+                                                     self.stage_outputs(stage) + self.quality_outputs(stage), code_version)
+        ]
+        # Fingerprint inputs before running, so a file changed mid-run is picked up next time
+        for stage in pending:
+            manifest.input_fingerprints(stage, self.stage_inputs(stage))
+
+        if self.parallel and len(pending) > 1:
+            executor = ProcessPoolExecutor(max_workers=len(pending))
+            futures = {stage: executor.submit(_run_stage, self.spawn(), stage, True) for stage in pending}
+            results = {stage: future.result for stage, future in futures.items()}
+        else:
+            executor = None
+            results = {stage: (lambda stage=stage: _run_stage(self.spawn(), stage)) for stage in pending}
+
+        try:
+            # Merge in stage order so the capped detail samples match a sequential run
+            for stage in stages:
+                if stage in results:
+                    fragment = results[stage]()
+                    manifest.record(stage, self.stage_inputs(stage), self.stage_outputs(stage) + self.quality_outputs(stage),
+                                    code_version, fragment)
+                else:
+                    fragment = manifest.report(stage)
+                    fragment = {**fragment, "performance": {"stages": {stage: {"skipped": True}}}}
+                    print(f"  {stage}: inputs unchanged, skipped")
+                self.merge_quality_report(fragment)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
     def run(self):
         print("Starting Data Pipeline...")
-        self.process_atenciones()
-        self.process_clientes()
-        self.process_eventos()
+        start = time.perf_counter()
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = Manifest(self.output_dir)
+        code_version = self.code_version()
+        self.run_stages(self.STAGES, manifest, code_version)
+        # Their inputs are the outputs just written, so they are only checked against the manifest now
+        self.run_stages(self.DEPENDENT_STAGES, manifest, code_version)
+        manifest.save()
+        self.quality_report["performance"]["wall_seconds"] = round(time.perf_counter() - start, 3)
         
         # Quality Report
         report_path = os.path.join(self.output_dir, "quality_report.json")
         with open(report_path, 'w') as f:
             json.dump(self.quality_report, f, indent=4)
         print(f"Pipeline finished. Metrics: {self.quality_report['summary']}")
+        for stage, stats in self.quality_report["performance"]["stages"].items():
+            if stats.get("skipped"):
+                continue
+            peak = f"peak RSS {stats['peak_rss_mb']} MB" if stats["peak_rss_mb"] is not None \
+                else f"process peak RSS {stats['process_peak_rss_mb']} MB"
+            print(f"  {stage}: {stats['wall_seconds']}s, {stats['rows_in']} -> {stats['rows_out']} rows, "
+                  f"{stats['rows_per_second']} rows/s, {peak}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="CALA Analytics Data Pipeline")
     parser.add_argument("--input", default="data/raw", help="Input directory")
     parser.add_argument("--output", default="output/processed", help="Output directory")
+    parser.add_argument("--rowwise", action="store_true", help="Use the legacy row-by-row normalization")
+    parser.add_argument("--chunksize", type=int, default=None, help="Stream atenciones/eventos in chunks of N rows (bounded memory)")
+    parser.add_argument("--parallel", action="store_true", help="Run the stages in a process pool")
+    parser.add_argument("--force", action="store_true", help="Re-run stages even if their inputs are unchanged")
+    parser.add_argument("--partitioned", action="store_true", help="Write fecha_proceso=YYYY-MM-DD/ partitions sorted by clustering keys")
+    parser.add_argument("--compression", default="snappy", help="Parquet compression codec (snappy, zstd, gzip, none)")
+    parser.add_argument("--row-group-size", type=int, default=None, help="Maximum rows per parquet row group")
+    parser.add_argument("--ds", default=None, help="With --partitioned, only rewrite this fecha_proceso (YYYY-MM-DD)")
+    parser.add_argument("--arrow", action="store_true", help="pyarrow dtype backend, categorical columns and typed BigQuery schemas")
     args = parser.parse_args()
     
-    pipeline = DataPipeline(args.input, args.output)
+    pipeline = DataPipeline(args.input, args.output, vectorized=not args.rowwise, chunksize=args.chunksize,
+                            parallel=args.parallel, force=args.force, partitioned=args.partitioned,
+                            compression=args.compression, row_group_size=args.row_group_size,
+                            process_date=args.ds, arrow=args.arrow)
     pipeline.run()
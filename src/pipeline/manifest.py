@@ -0,0 +1,128 @@
+import glob
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+MANIFEST_NAME = "_manifest.json"
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sources_sha256(directory: str) -> str:
+    """Hash of the names and contents of the .py files in directory, in sorted order."""
+    digest = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        digest.update(os.path.basename(path).encode())
+        digest.update(file_sha256(path).encode())
+    return digest.hexdigest()
+
+
+def directory_listing(path: str) -> List[List[Any]]:
+    """(relative path, size, mtime) of the published files under a partitioned directory; staging dirs are skipped."""
+    listing = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            stat = os.stat(os.path.join(root, name))
+            listing.append([os.path.relpath(os.path.join(root, name), path), stat.st_size, stat.st_mtime_ns])
+    return listing
+
+
+def listing_sha256(path: str) -> str:
+    return hashlib.sha256(json.dumps(directory_listing(path)).encode()).hexdigest()
+
+
+def fingerprint(path: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Size, mtime and content hash of a file. The hash is reused while size and mtime
+    are unchanged. A directory is hashed by its file listing instead of its content.
+    """
+    stat = os.stat(path)
+    if os.path.isdir(path):
+        listing = directory_listing(path)
+        return {"size": sum(entry[1] for entry in listing), "mtime_ns": stat.st_mtime_ns,
+                "sha256": hashlib.sha256(json.dumps(listing).encode()).hexdigest()}
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        sha256 = previous["sha256"]
+    else:
+        sha256 = file_sha256(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+
+
+def output_size(path: str) -> int:
+    """Size of an output file, or total size of a partitioned output directory."""
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+class Manifest:
+    """
+    Per-stage record of the input fingerprints, code version and outputs of the
+    last successful run, plus the quality-report fragment the stage produced, so
+    an unchanged stage can be skipped without losing its metrics.
+    """
+
+    def __init__(self, output_dir: str):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.stages: Dict[str, Any] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    self.stages = json.load(f).get("stages", {})
+            except (OSError, ValueError):
+                # A corrupt manifest only costs a full re-run
+                self.stages = {}
+        self._fingerprints: Dict[str, Dict[str, Any]] = {}
+
+    def input_fingerprints(self, stage: str, inputs: List[str]) -> Dict[str, Any]:
+        previous = self.stages.get(stage, {}).get("inputs", {})
+        result = {}
+        for path in inputs:
+            key = os.path.abspath(path)
+            if key not in self._fingerprints:
+                self._fingerprints[key] = fingerprint(path, previous.get(key))
+            result[key] = self._fingerprints[key]
+        return result
+
+    def is_current(self, stage: str, inputs: List[str], outputs: List[str], code_version: str) -> bool:
+        entry = self.stages.get(stage)
+        if not entry or entry.get("code_version") != code_version:
+            return False
+        current = self.input_fingerprints(stage, inputs)
+        if {k: v["sha256"] for k, v in current.items()} != {k: v["sha256"] for k, v in entry["inputs"].items()}:
+            return False
+        recorded_outputs = entry.get("outputs", {})
+        for path in outputs:
+            key = os.path.abspath(path)
+            if key not in recorded_outputs or not os.path.exists(path) or output_size(path) != recorded_outputs[key]["size"]:
+                return False
+        # Same content: keep the fresh mtimes so the next run can trust them without re-hashing
+        entry["inputs"] = current
+        return True
+
+    def record(self, stage: str, inputs: List[str], outputs: List[str], code_version: str,
+               report: Dict[str, Any]) -> None:
+        self.stages[stage] = {
+            "code_version": code_version,
+            "inputs": self.input_fingerprints(stage, inputs),
+            "outputs": {os.path.abspath(path): {"size": output_size(path)} for path in outputs},
+            "report": report,
+        }
+        self.save()
+
+    def report(self, stage: str) -> Dict[str, Any]:
+        return self.stages[stage]["report"]
+
+    def save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"stages": self.stages}, f)
+        os.replace(tmp_path, self.path)
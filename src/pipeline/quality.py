@@ -0,0 +1,102 @@
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Records buffered before they are written as one row group
+RECORD_BATCH_ROWS = 65_536
+# Records kept per category in quality_report.json (the bound its details always had); the parquet
+# sidecars hold all of them
+SAMPLE_SIZE = 500
+
+
+def string_array(values: Any) -> pa.Array:
+    """Values as an Arrow string array; ids and raw values arrive as ints, objects or Arrow strings."""
+    try:
+        array = pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed Python types in an object column
+        array = pa.array([None if v is None or v is pd.NA or v != v else str(v) for v in values])
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    return array if pa.types.is_string(array.type) else array.cast(pa.string())
+
+
+def column_array(values: Any, target: pa.DataType, length: int) -> pa.Array:
+    if isinstance(values, str):
+        # Constant column (stage, rule): one dictionary entry, not one string per row
+        if pa.types.is_dictionary(target):
+            return pa.DictionaryArray.from_arrays(pa.array(np.zeros(length, dtype=np.int32)), pa.array([values]))
+        return pa.repeat(pa.scalar(values, pa.string()), length)
+    if pa.types.is_dictionary(target):
+        return string_array(values).dictionary_encode()
+    return string_array(values)
+
+
+class RecordSink:
+    """
+    Appends quality records to a parquet file, a row at a time (a tuple append)
+    or as columns (Arrow arrays built without per-row Python work), and writes
+    them in row groups of RECORD_BATCH_ROWS. Until open() is called, records are
+    dropped: the report counters and samples do not depend on the sink.
+    """
+
+    def __init__(self, schema: pa.Schema, batch_rows: int = RECORD_BATCH_ROWS):
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.writer: Optional[pq.ParquetWriter] = None
+        self.rows = []
+        self.batches = []
+        self.pending = 0
+
+    def open(self, path: str, compression: str = "snappy") -> None:
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+
+    def append(self, *values) -> None:
+        if self.writer is None:
+            return
+        self.rows.append(values)
+        self.pending += 1
+        if self.pending >= self.batch_rows:
+            self.flush()
+
+    def extend(self, *columns) -> None:
+        """One value per field: an array-like of equal length, or a str repeated on every row."""
+        if self.writer is None:
+            return
+        length = next(len(column) for column in columns if not isinstance(column, str))
+        if not length:
+            return
+        # Rows appended earlier are written first, so the file keeps the logging order
+        self.batch_pending_rows()
+        arrays = [column_array(column, field.type, length) for column, field in zip(columns, self.schema)]
+        self.batches.append(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self.pending += length
+        if self.pending >= self.batch_rows:
+            self.flush()
+
+    def batch_pending_rows(self) -> None:
+        if self.rows:
+            columns = list(zip(*self.rows))
+            arrays = [column_array(list(column), field.type, len(self.rows)) for column, field in zip(columns, self.schema)]
+            self.batches.append(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+            self.rows = []
+
+    def flush(self) -> None:
+        self.batch_pending_rows()
+        if self.batches:
+            table = pa.Table.from_batches(self.batches, schema=self.schema)
+            # Independent dictionaries per batch; unify them so the row group has a single one
+            self.writer.write_table(table.unify_dictionaries().combine_chunks())
+        self.batches = []
+        self.pending = 0
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
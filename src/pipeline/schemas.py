@@ -0,0 +1,123 @@
+from typing import Dict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Low-cardinality strings are dictionary-encoded: categorical in pandas, DICTIONARY in parquet
+LOW_CARDINALITY = pa.dictionary(pa.int32(), pa.string())
+
+# Mirrors stg_atenciones / fct_atenciones in src/modeling/bigquery_queries.sql
+ATENCIONES_SCHEMA = pa.schema([
+    ("id_atencion", pa.int64()),
+    ("id_cliente", pa.int64()),
+    ("documento_cliente", pa.string()),
+    ("fecha_atencion", pa.timestamp("us", tz="UTC")),
+    ("fecha_proceso", pa.date32()),
+    ("valor_facturado", pa.float64()),
+    ("estado", LOW_CARDINALITY),
+    ("codigo_cups", pa.string()),
+    ("canal_ingreso", LOW_CARDINALITY),
+    ("diagnostico", LOW_CARDINALITY),
+    ("medico", LOW_CARDINALITY),
+])
+
+CLIENTES_SCHEMA = pa.schema([
+    ("id_cliente", pa.int64()),
+    ("documento", pa.string()),
+    ("fecha_registro", pa.date32()),
+    ("segmento", LOW_CARDINALITY),
+    ("ciudad", LOW_CARDINALITY),
+    ("score_crediticio", pa.int64()),
+])
+
+# id_cliente is INT64 so the eventos-atenciones join in bigquery_queries.sql compares like types
+EVENTOS_SCHEMA = pa.schema([
+    ("id_evento", pa.int64()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("id_cliente", pa.int64()),
+    ("tipo_evento", LOW_CARDINALITY),
+    ("metadata_ip", pa.string()),
+    ("fecha_proceso", pa.date32()),
+])
+
+# Rows of atenciones/eventos that fail the join against clientes (see DataPipeline.process_integrity)
+INTEGRITY_QUARANTINE_SCHEMA = pa.schema([
+    ("tabla", LOW_CARDINALITY),
+    ("id_registro", pa.int64()),
+    ("id_cliente", pa.int64()),
+    ("documento", pa.string()),
+    ("documento_esperado", pa.string()),
+    ("motivo", LOW_CARDINALITY),
+])
+
+# One row per cleaned or rejected value (see src/pipeline/quality.py); record ids are kept as text
+QUALITY_EVENTS_SCHEMA = pa.schema([
+    ("stage", LOW_CARDINALITY),
+    ("rule", LOW_CARDINALITY),
+    ("record_id", pa.string()),
+    ("original", pa.string()),
+    ("cleaned", pa.string()),
+])
+
+# Source values rejected by validation (today: json_detalle), which the cleaned tables do not keep;
+# named like QUALITY_EVENTS_SCHEMA, so both sidecars join on (stage, rule, record_id)
+QUALITY_QUARANTINE_SCHEMA = pa.schema([
+    ("stage", LOW_CARDINALITY),
+    ("rule", LOW_CARDINALITY),
+    ("record_id", pa.string()),
+    ("original", pa.string()),
+    ("error", pa.string()),
+])
+
+# Mirrors the daily KPIs query in bigquery_queries.sql (see src/pipeline/kpis.py)
+KPI_DAILY_SCHEMA = pa.schema([
+    ("fecha_proceso", pa.date32()),
+    ("canal_ingreso", LOW_CARDINALITY),
+    ("estado", LOW_CARDINALITY),
+    ("total_atenciones", pa.int64()),
+    # COUNT(valor_facturado): the rows averaged by /kpis' promedio_facturado
+    ("atenciones_facturadas", pa.int64()),
+    ("total_facturado", pa.float64()),
+])
+
+TABLE_SCHEMAS: Dict[str, pa.Schema] = {
+    "atenciones": ATENCIONES_SCHEMA,
+    "clientes": CLIENTES_SCHEMA,
+    "eventos": EVENTOS_SCHEMA,
+}
+
+
+def low_cardinality_columns(schema: pa.Schema):
+    return [field.name for field in schema if pa.types.is_dictionary(field.type)]
+
+
+def _conform_array(values: pd.Series, target: pa.DataType) -> pa.Array:
+    if pd.api.types.is_string_dtype(values.dtype) and not (pa.types.is_string(target) or pa.types.is_dictionary(target)):
+        # Cleaned documents can be empty strings; they load as NULL into typed columns
+        values = values.where(values != "", None)
+    array = pa.Array.from_pandas(values)
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    if array.type == target:
+        return array
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    if pa.types.is_dictionary(target):
+        return array.cast(target.value_type).dictionary_encode().cast(target)
+    if pa.types.is_timestamp(target) and pa.types.is_timestamp(array.type) and array.type.tz is None and target.tz:
+        # Naive source timestamps are UTC
+        array = pc.assume_timezone(array, target.tz)
+    # Source timestamps carry at most microseconds, so ns -> us never drops data
+    return array.cast(target, safe=not pa.types.is_timestamp(target))
+
+
+def to_arrow_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """Casts a cleaned DataFrame to an explicit output schema. Missing columns are written as NULL."""
+    arrays = []
+    for field in schema:
+        if field.name in df.columns:
+            arrays.append(_conform_array(df[field.name], field.type))
+        else:
+            arrays.append(pa.nulls(len(df), field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
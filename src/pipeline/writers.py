@@ -0,0 +1,148 @@
+import os
+import shutil
+import uuid
+from typing import Dict, List, Optional, Set
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.pipeline.schemas import to_arrow_table
+
+# Hive's name for rows whose partition value is missing
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+
+def cleaned_output_path(output_dir: str, name: str, partitioned: bool) -> str:
+    """Where a cleaned table is written: a Hive-partitioned directory or a single parquet file."""
+    return os.path.join(output_dir, f"{name}_cleaned" if partitioned else f"{name}_cleaned.parquet")
+
+
+def arrow_schema(df: pd.DataFrame) -> pa.Schema:
+    """Schema for a first batch; all-null columns are typed as strings so later batches still fit."""
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(i, field.with_type(pa.string()))
+    return schema
+
+
+class ParquetFileSink:
+    """Appends DataFrame batches to a single parquet file, one or more row groups per batch."""
+
+    def __init__(self, path: str, compression: str = "snappy", row_group_size: Optional[int] = None,
+                 schema: Optional[pa.Schema] = None):
+        self.path = path
+        self.compression = compression
+        self.row_group_size = row_group_size
+        # Explicit output schema; by default it is inferred from the first batch
+        self.schema = schema
+        self.writer: Optional[pq.ParquetWriter] = None
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, self.schema or arrow_schema(df), compression=self.compression,
+                                           write_statistics=True)
+        if self.schema is not None:
+            table = to_arrow_table(df, self.schema)
+        else:
+            df = df.reindex(columns=self.writer.schema.names)
+            table = pa.Table.from_pandas(df, schema=self.writer.schema, preserve_index=False)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PartitionedParquetSink:
+    """
+    Writes `<root>/<column>=<value>/part-NNNNN.parquet` files (Hive layout, as
+    BigQuery external/partitioned loads expect), each sorted by the clustering
+    keys so row-group statistics can prune reads.
+
+    Partitions are staged next to their final location and swapped in on close.
+    With `only` set (e.g. a single `{{ ds }}`), rows of any other partition are
+    ignored and every other partition is left untouched; otherwise the run is a
+    full rewrite and partitions it wrote no rows to are removed.
+    """
+
+    def __init__(self, root: str, column: str, sort_keys: List[str], compression: str = "snappy",
+                 row_group_size: Optional[int] = None, only: Optional[str] = None,
+                 schema: Optional[pa.Schema] = None):
+        self.root = root
+        self.column = column
+        self.sort_keys = sort_keys
+        self.compression = compression
+        self.row_group_size = row_group_size
+        self.only = only
+        # The partition column lives in the directory names, not in the files
+        self.schema = schema.remove(schema.get_field_index(column)) if schema is not None else None
+        self.explicit_schema = schema is not None
+        self.staged: Dict[str, str] = {}
+        self.written: Set[str] = set()
+        self.parts: Dict[str, int] = {}
+        self.token = uuid.uuid4().hex[:8]
+
+    def write(self, df: pd.DataFrame) -> None:
+        values = df[self.column].astype(str).where(df[self.column].notna(), DEFAULT_PARTITION)
+        if self.only is not None:
+            df, values = df[values == self.only], values[values == self.only]
+        data = df.drop(columns=[self.column])
+        if self.schema is None and len(data):
+            self.schema = arrow_schema(data)
+
+        for value, part in data.groupby(values.to_numpy(), sort=True):
+            part = part.sort_values(by=self.sort_keys, kind='stable')
+            staging_dir = self.staged.get(value)
+            if staging_dir is None:
+                staging_dir = os.path.join(self.root, f".{self.column}={value}.{self.token}")
+                os.makedirs(staging_dir)
+                self.staged[value] = staging_dir
+            seq = self.parts.get(value, 0)
+            self.parts[value] = seq + 1
+            if self.explicit_schema:
+                table = to_arrow_table(part, self.schema)
+            else:
+                table = pa.Table.from_pandas(part.reindex(columns=self.schema.names), schema=self.schema,
+                                             preserve_index=False)
+            pq.write_table(table, os.path.join(staging_dir, f"part-{seq:05d}.parquet"),
+                           compression=self.compression, row_group_size=self.row_group_size,
+                           write_statistics=True)
+
+    def close(self) -> None:
+        for value, staging_dir in self.staged.items():
+            final_dir = os.path.join(self.root, f"{self.column}={value}")
+            # The old partition is renamed aside and deleted after the swap, so readers find either
+            # version and the partition is only missing between two renames
+            old_dir = f"{staging_dir}.old"
+            if os.path.exists(final_dir):
+                os.replace(final_dir, old_dir)
+            os.replace(staging_dir, final_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+            self.written.add(value)
+        self.staged = {}
+        if self.only is None:
+            prefix = f"{self.column}="
+            for name in os.listdir(self.root):
+                if name.startswith(prefix) and name[len(prefix):] not in self.written:
+                    shutil.rmtree(os.path.join(self.root, name))
+
+    def __enter__(self):
+        os.makedirs(self.root, exist_ok=True)
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None:
+            # Never publish partial partitions, nor remove the ones a failed run did not get to write
+            for staging_dir in self.staged.values():
+                shutil.rmtree(staging_dir, ignore_errors=True)
+            self.staged = {}
+            return
+        self.close()
@@ -0,0 +1,85 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# flat: exact scan. ivf: inverted lists, scans nprobe of nlist cells. hnsw: graph search, efSearch candidates.
+# ivfpq: IVF with product-quantized codes (~pq_m bytes per vector). flat_fp16: exact scan over float16 vectors.
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq", "flat_fp16")
+METRICS = ("l2", "ip")
+
+DEFAULT_PARAMS = {"nlist": None, "M": 32, "pq_m": 48, "nprobe": 8, "ef_search": 64}
+# k-means wants ~39 training points per centroid before faiss warns about it
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_spec(index_type, n, d, params):
+    """faiss.index_factory string for index_type, sized for n training vectors of dimension d."""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "flat_fp16":
+        return "SQfp16"
+    if index_type == "hnsw":
+        return f"HNSW{params['M']}"
+    nlist = params["nlist"] or max(1, min(int(4 * np.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    # Largest sub-quantizer count <= pq_m that divides d, and at most 2**nbits <= n codes per sub-quantizer.
+    # "np" skips the polysemous training faiss otherwise runs for PQ codes, which search never uses
+    pq_m = max(m for m in range(1, params["pq_m"] + 1) if d % m == 0)
+    nbits = min(8, int(np.log2(n)))
+    return f"IVF{nlist},PQ{pq_m}x{nbits}np"
+
+
+def create_index(embeddings, index_type="flat", metric="l2", **params):
+    """
+    Builds, trains (IVF variants) and fills a FAISS index with the embeddings.
+    Trained variants fall back to an exact flat index when there are too few
+    vectors to train them.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+    # faiss is imported where it is used, so importing the API (which only serves a loaded index) does not load it
+    import faiss
+
+    params = {**DEFAULT_PARAMS, **params}
+    n, d = embeddings.shape
+    if index_type in ("ivf", "ivfpq") and n < 2:
+        logger.warning("%d vectors are not enough to train a '%s' index; using 'flat'.", n, index_type)
+        index_type = "flat"
+    faiss_metric = faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+    index = faiss.index_factory(d, index_spec(index_type, n, d, params), faiss_metric)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    configure_search(index, nprobe=params["nprobe"], ef_search=params["ef_search"])
+    return index
+
+
+def configure_search(index, nprobe=None, ef_search=None):
+    """Sets the search-time knobs the index has: nprobe for IVF, efSearch for HNSW."""
+    import faiss
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None and ef_search:
+        hnsw.efSearch = ef_search
+
+
+def to_l2(distances, metric):
+    """Inner products of normalized vectors as squared L2 distances (|a-b|^2 = 2 - 2<a,b>), so thresholds hold."""
+    if metric == "ip":
+        return np.maximum(0.0, 2.0 - 2.0 * distances)
+    return distances
+
+
+def index_bytes(index):
+    """Serialized size of the index, a close proxy for its memory footprint."""
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Cosine distance under which two questions share an answer. Paraphrase-MiniLM puts typing variants
+# ("qué es un CUPS", "que es un cups?") within ~0.01 of each other, unrelated questions well above 0.1.
+SEMANTIC_DISTANCE = 0.02
+
+
+class AnswerCache:
+    """
+    Bounded LRU cache of ask() answers with a time to live, in two layers: by
+    normalized question text, and by query embedding (a new question whose
+    normalized embedding lies within `semantic_distance` cosine distance of a
+    cached one gets its answer). `max_entries=0` disables it, as does
+    `semantic_distance=None` for the embedding layer. Thread-safe.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, semantic_distance=SEMANTIC_DISTANCE):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_distance = semantic_distance
+        self.lock = threading.Lock()
+        self.exact_hits = self.semantic_hits = self.misses = 0
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # question key -> (answer, expiry time)
+            self.answers = OrderedDict()
+            # Embedding layer: one row per slot; free slots and expired entries never match (expiry 0)
+            self.vectors = None
+            self.expiry = np.zeros(self.max_entries, dtype='float64')
+            self.slot_answers = [None] * self.max_entries
+            self.slots = OrderedDict()
+
+    def get(self, key):
+        """Answer cached for the question key, or None."""
+        if not self.max_entries:
+            return None
+        with self.lock:
+            entry = self.answers.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.answers.move_to_end(key)
+                self.exact_hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.answers[key]
+            if self.semantic_distance is None:
+                self.misses += 1
+            return None
+
+    def get_similar(self, embedding):
+        """Answer of the nearest cached question embedding within semantic_distance, or None."""
+        if not self.max_entries or self.semantic_distance is None:
+            return None
+        with self.lock:
+            if embedding is not None and self.slots:
+                distances = 1.0 - self.vectors @ embedding
+                distances[self.expiry <= time.monotonic()] = np.inf
+                slot = int(np.argmin(distances))
+                if distances[slot] <= self.semantic_distance:
+                    self.slots.move_to_end(slot)
+                    self.semantic_hits += 1
+                    return self.slot_answers[slot]
+            self.misses += 1
+            return None
+
+    def put(self, key, answer, embedding=None):
+        """Caches the answer under the question key and, when given, its normalized query embedding."""
+        if not self.max_entries:
+            return
+        expires = time.monotonic() + self.ttl_seconds
+        with self.lock:
+            self.answers[key] = (answer, expires)
+            self.answers.move_to_end(key)
+            while len(self.answers) > self.max_entries:
+                self.answers.popitem(last=False)
+            if embedding is None or self.semantic_distance is None:
+                return
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(embedding)), dtype='float32')
+            if len(self.slots) < self.max_entries:
+                slot = len(self.slots)
+            else:
+                slot, _ = self.slots.popitem(last=False)
+            self.vectors[slot] = embedding
+            self.expiry[slot] = expires
+            self.slot_answers[slot] = answer
+            self.slots[slot] = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "entries": len(self.answers),
+            }
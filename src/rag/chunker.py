@@ -0,0 +1,113 @@
+import glob
+import hashlib
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Whitespace tokens per chunk. paraphrase-multilingual-MiniLM-L12-v2 truncates at 128
+# word pieces, roughly 96 Spanish words; longer chunks would be embedded only in part.
+MAX_TOKENS = 96
+OVERLAP_TOKENS = 16
+# Chunks this short (in characters) carry no retrievable content
+MIN_CHUNK_CHARS = 15
+ENCODINGS = ['utf-8', 'latin1', 'cp1252']
+# Below this many files per worker, forking a pool costs more than it saves
+MIN_FILES_PER_WORKER = 32
+# Files chunked ahead of the consumer, per worker: chunking outpaces embedding, so an unbounded
+# read-ahead would end up holding the chunks of the whole KB
+FILES_IN_FLIGHT_PER_WORKER = 2
+
+
+def read_kb_file(file_path):
+    """sha256 of the raw bytes and the decoded text, with the newline handling of text-mode reads."""
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    content = ""
+    for enc in ENCODINGS:
+        try:
+            content = raw.decode(enc).replace('\r\n', '\n').replace('\r', '\n')
+            break
+        except UnicodeDecodeError:
+            continue
+    return hashlib.sha256(raw).hexdigest(), content
+
+
+def is_item_start(line):
+    # A new bullet point, numbered item or question breaks the previous chunk
+    return (line.startswith('* ') or line.startswith('- ') or line.startswith('¿')
+            or (len(line) > 2 and line[1] == '.' and line[0].isdigit()) or line.startswith('•'))
+
+
+def split_tokens(chunk_text, header, max_tokens, overlap):
+    """Windows of at most max_tokens body tokens, overlapping by `overlap`; each keeps the section header."""
+    header = re.sub(r'\s+', ' ', header).strip()
+    prefix = f"{header}: " if header and chunk_text.startswith(f"{header}: ") else ""
+    tokens = chunk_text[len(prefix):].split(' ')
+    if not max_tokens or len(tokens) <= max_tokens:
+        return [chunk_text]
+    step = max(1, max_tokens - overlap)
+    return [prefix + ' '.join(tokens[start:start + max_tokens])
+            for start in range(0, max(1, len(tokens) - overlap), step)]
+
+
+def chunk_document(content, max_tokens=MAX_TOKENS, overlap=OVERLAP_TOKENS):
+    """
+    Yields the chunks of a markdown document: paragraphs and list items, each
+    prefixed with the markdown header (`#`) they belong to.
+    """
+    current_chunk = []
+    current_header = ""
+
+    def flush():
+        chunk_text = " ".join(current_chunk).strip()
+        if current_header and not chunk_text.startswith(current_header):
+            chunk_text = f"{current_header}: {chunk_text}"
+        if len(chunk_text) <= MIN_CHUNK_CHARS:
+            return []
+        return split_tokens(re.sub(r'\s+', ' ', chunk_text).strip(), current_header, max_tokens, overlap)
+
+    for line in (line.strip() for line in content.split('\n')):
+        if not line or line.startswith('#') or is_item_start(line):
+            if current_chunk:
+                yield from flush()
+            current_chunk = [line] if line and not line.startswith('#') else []
+            if line.startswith('#'):
+                current_header = line.strip('# ')
+        else:
+            current_chunk.append(line)
+    if current_chunk:
+        yield from flush()
+
+
+def chunk_file(file_path, max_tokens=MAX_TOKENS, overlap=OVERLAP_TOKENS):
+    """Process-pool task: (file name, sha256, chunks) of one KB file. The raw text never leaves the worker."""
+    sha256, content = read_kb_file(file_path)
+    return os.path.basename(file_path), sha256, list(chunk_document(content, max_tokens, overlap))
+
+
+def iter_kb_chunks(kb_dir, workers=None, max_tokens=MAX_TOKENS, overlap=OVERLAP_TOKENS):
+    """
+    Yields (file name, sha256, chunks) for every `*.md` file of kb_dir, in name
+    order. With workers > 1 files are read and chunked in a process pool, at most
+    FILES_IN_FLIGHT_PER_WORKER files per worker ahead of the consumer (e.g. the
+    embedding loop); by default one worker per CPU, as long as each gets
+    MIN_FILES_PER_WORKER files, so small KBs are chunked in this process.
+    """
+    files = sorted(glob.glob(os.path.join(kb_dir, "*.md")))
+    task = partial(chunk_file, max_tokens=max_tokens, overlap=overlap)
+    if workers is None:
+        workers = min(os.cpu_count() or 1, len(files) // MIN_FILES_PER_WORKER)
+    if workers <= 1:
+        yield from map(task, files)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for file_path in files:
+            if len(pending) >= workers * FILES_IN_FLIGHT_PER_WORKER:
+                # The next file is submitted only once the oldest result has been consumed
+                yield pending.popleft().result()
+            pending.append(executor.submit(task, file_path))
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+import numpy as np
+
+class LexicalIndex:
+    """
+    Inverted index from term to chunk ids with BM25 scoring. Chunks are indexed
+    by their set of accent-stripped lemmas, so term frequency is binary and the
+    document length is the number of distinct lemmas.
+    """
+
+    def __init__(self, documents, k1=1.2, b=0.75):
+        postings = defaultdict(list)
+        lengths = np.zeros(len(documents), dtype='float32')
+        for doc_id, terms in enumerate(documents):
+            terms = set(terms)
+            lengths[doc_id] = len(terms)
+            for term in terms:
+                postings[term].append(doc_id)
+        self.postings = {term: np.array(ids, dtype='int64') for term, ids in postings.items()}
+        n = len(documents)
+        self.idf = {term: float(np.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))) for term, ids in self.postings.items()}
+        avg_length = lengths.mean() if n else 0.0
+        # BM25 weight of a matching term in each chunk, up to the term's idf
+        self.weights = (k1 + 1) / (1 + k1 * (1 - b + b * lengths / avg_length)) if n else lengths
+        self.size = n
+
+    def chunks_with(self, term):
+        return self.postings.get(term, ())
+
+    def search(self, terms, k):
+        """Top-k chunk ids by BM25 over the query terms; only the postings of those terms are touched."""
+        matches = [(self.postings[term], self.idf[term]) for term in set(terms) if term in self.postings]
+        if not matches:
+            return np.empty(0, dtype='int64'), np.empty(0, dtype='float32')
+        ids = np.concatenate([ids for ids, _ in matches])
+        scores = np.concatenate([np.full(len(ids), idf, dtype='float32') for ids, idf in matches]) * self.weights[ids]
+        ids, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=scores)
+        top = np.argsort(-scores, kind='stable')[:k]
+        return ids[top], scores[top]
+
+
+def candidate_union(*rankings):
+    """Ids of all the rankings, each once, in order of first appearance (earlier rankings first)."""
+    return list(dict.fromkeys(int(doc_id) for ranking in rankings for doc_id in ranking))
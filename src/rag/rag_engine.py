@@ -7,186 +7,510 @@ os.environ['USE_TORCH'] = '1'
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 os.environ['TRANSFORMERS_NO_TENSORFLOW'] = '1'
 
-import glob
+import copy
+import logging
+import time
 import unicodedata
 import re
-from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
-import spacy
+import pyarrow as pa
+
+# Add project root to path for local imports
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(project_root)
+
+from src.rag.answer_cache import SEMANTIC_DISTANCE, AnswerCache
+from src.rag.ann_index import DEFAULT_PARAMS, configure_search, create_index, to_l2
+from src.rag.chunker import MAX_TOKENS, OVERLAP_TOKENS, iter_kb_chunks
+from src.rag.lexical_index import LexicalIndex, candidate_union
+from src.rag.snapshot import current_snapshot, metadata_column, read_snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout of the persisted index changes
+INDEX_CACHE_VERSION = 4
+# New chunks are embedded (and their vectors kept) in batches of this size while the KB is chunked
+EMBED_BATCH_CHUNKS = 2048
+# Texts per forward pass of the embedding model (sentence-transformers' default)
+ENCODE_BATCH_SIZE = 32
+# Dense (and BM25) candidates per question
+ASK_TOP_K = 15
+# Only tagging and lemmatization are used; the dependency parser and NER are the costly components
+SPACY_EXCLUDE = ["parser", "ner"]
+
+# Diccionario técnico para validar acrónimos y términos clave (Usamos lemas/raíces)
+TECH_DICTIONARY = {
+    "cups", "dx", "kpi", "json", "parquet", "bigquery", "airflow", "cala", "web", "app", "call", 
+    "medico", "diagnostico", "atencion", "facturado", "calidad", "error", "tasa", "arquitectura", 
+    "propuesta", "pipeline", "transaccional", "procesamiento", "duplicado", "limpieza", 
+    "ciudad", "clasificacion", "salud", "procedimiento", "cie-10", "identificar", "intervencion",
+    "login", "click", "compra", "autenticacion", "interaccion", "digital", "politica", "total", 
+    "promedio", "evento", "instruccion", "prueba", "cliente", "csv", "json_detalle", "orquestacion", 
+    "gcp", "nube", "fallo", "sistema", "valido", "procesada", "descartado", "facturacion",
+    "distribucion", "canal", "alfanumerico", "estandarizada", "reporte", "resultado", "financiero",
+    "documento", "limpiar", "objetivo", "insumo", "particion", "consulta", "optimizado", 
+    "idempotente", "despliegue", "composer", "faiss", "endpoint", "health", "ask", "tecnico", "tecnica"
+}
+
+# Bloqueo explícito de ruidos conocidos
+NOISE_TRIGGERS = {"sol", "pizza", "color", "clima", "mundial", "dolar", "helado", "avion", "gato", "presidente", "musica", "hambre", "francia", "pasta", "precio", "capital", "vendes", "volar", "receta", "cuanto", "mas"}
+
+def strip_accents(s):
+    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+
+def normalize_question(question):
+    """Answer-cache key: lowercase, accent-stripped, single-spaced."""
+    return ' '.join(strip_accents(question.lower()).split())
 
 class RAGSystem:
-    def __init__(self, kb_dir, model_name='paraphrase-multilingual-MiniLM-L12-v2'):
+    def __init__(self, kb_dir, model_name='paraphrase-multilingual-MiniLM-L12-v2', cache_dir="output/rag_index",
+                 index_type="flat", metric="l2", index_params=None, max_tokens=MAX_TOKENS,
+                 overlap_tokens=OVERLAP_TOKENS, chunk_workers=None, encode_batch_size=ENCODE_BATCH_SIZE,
+                 encode_workers=None, quantize=False, answer_cache_size=1024, answer_cache_ttl=3600,
+                 semantic_cache_distance=SEMANTIC_DISTANCE):
         self.kb_dir = kb_dir
+        # Chunking (see src/rag/chunker.py): token cap and overlap, and reader processes (None = auto)
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.chunk_workers = chunk_workers
+        self.model_name = model_name
+        # Embedding throughput: texts per forward pass, encoding processes (None/1 = this one, -1 = one
+        # per core) and int8 dynamic quantization of the model's linear layers for CPU-only hosts
+        self.encode_batch_size = encode_batch_size
+        self.encode_workers = os.cpu_count() if encode_workers == -1 else encode_workers
+        self.quantize = quantize
+        # Quantized embeddings differ slightly from fp32 ones, so they are cached apart
+        self.model_key = f"{model_name}-int8" if quantize else model_name
+        # ANN backend (see src/rag/ann_index.py); distances are reported as squared L2 whatever the metric
+        self.index_type = index_type
+        self.metric = metric
+        self.index_params = {**DEFAULT_PARAMS, **(index_params or {})}
+        # sentence-transformers, torch and spaCy take seconds to import, so they are imported when a
+        # RAGSystem is created rather than with this module (the API starts serving before that)
+        from sentence_transformers import SentenceTransformer
         # Switch to a high-quality multilingual model
         self.model = SentenceTransformer(model_name, device='cpu')
+        if quantize:
+            import torch
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.encode_pool = None
         self.index = None
         self.chunks = []
         self.metadata = []
+        self.embeddings = None
+        # BM25 over chunk lemmas, and the chunks containing each TECH_DICTIONARY term (see build_lexical_index)
+        self.lexical = None
+        self.tech_chunks = {}
+        # Answers of repeated (or near-identical) questions, cleared whenever the index changes
+        self.answer_cache = AnswerCache(answer_cache_size, answer_cache_ttl, semantic_cache_distance)
+        # Optional callable receiving {stage: seconds} of ask(): embed and search once per batch of
+        # questions, lemmatize, rerank and select once per answered question (see src/api/app.py)
+        self.on_timings = None
+        # sha256 of each KB file read by load_and_chunk
+        self.file_hashes = {}
+        # Persisted snapshot the index was loaded from or saved to (see src/rag/snapshot.py)
+        self.snapshot = None
+        # Persisted index, chunks and embeddings, one directory per embedding model (None disables it)
+        self.cache_dir = os.path.join(cache_dir, re.sub(r'[^\w.-]', '_', self.model_key)) if cache_dir else None
         
         # Load SpaCy for lemmatization
         try:
-            self.nlp = spacy.load("es_core_news_lg")
+            import spacy
+            self.nlp = spacy.load("es_core_news_lg", exclude=SPACY_EXCLUDE)
         except:
             # Fallback if model not found (though it should be)
             self.nlp = None
-            print("WARNING: SpaCy model 'es_core_news_lg' not found. Lemmatization disabled.")
+            logger.warning("SpaCy model 'es_core_news_lg' not found. Lemmatization disabled.")
 
     def load_and_chunk(self):
-        files = glob.glob(os.path.join(self.kb_dir, "*.md"))
-        for file_path in files:
-            file_name = os.path.basename(file_path)
-            content = ""
-            for enc in ['utf-8', 'latin1', 'cp1252']:
-                try:
-                    with open(file_path, 'r', encoding=enc) as f:
-                        content = f.read()
-                        break
-                except: continue
-            
-            if not content: continue
-            
-            content = content.replace('\r', '')
-            lines = [line.strip() for line in content.split('\n')]
-            current_chunk = []
-            current_header = ""
-            
-            for line in lines:
-                if not line:
-                    if current_chunk:
-                        chunk_text = " ".join(current_chunk).strip()
-                        if current_header and not chunk_text.startswith(current_header):
-                            chunk_text = f"{current_header}: {chunk_text}"
-                        if len(chunk_text) > 15:
-                            chunk_text = re.sub(r'\s+', ' ', chunk_text).strip()
-                            self.chunks.append(chunk_text)
-                            self.metadata.append({"file": file_name, "text": chunk_text})
-                        current_chunk = []
-                    continue
-                
-                if line.startswith('#'):
-                    if current_chunk:
-                        chunk_text = " ".join(current_chunk).strip()
-                        if current_header and not chunk_text.startswith(current_header):
-                            chunk_text = f"{current_header}: {chunk_text}"
-                        if len(chunk_text) > 15:
-                            chunk_text = re.sub(r'\s+', ' ', chunk_text).strip()
-                            self.chunks.append(chunk_text)
-                            self.metadata.append({"file": file_name, "text": chunk_text})
-                        current_chunk = []
-                    current_header = line.strip('# ')
+        for file_name, sha256, chunks in self.iter_chunks():
+            self.file_hashes[file_name] = sha256
+            for chunk_text in chunks:
+                self.chunks.append(chunk_text)
+                self.metadata.append({"file": file_name, "text": chunk_text})
+
+    def iter_chunks(self):
+        return iter_kb_chunks(self.kb_dir, workers=self.chunk_workers, max_tokens=self.max_tokens,
+                              overlap=self.overlap_tokens)
+
+    def index_kb(self):
+        """Chunks the KB in worker processes while the main process embeds: load_and_chunk + build_index in one pass."""
+        self.chunks, self.metadata = [], []
+        self.build_index(self.iter_chunks())
+
+    def build_index(self, files=None):
+        """
+        Embeds the chunks and builds the FAISS index. With a cache directory, the
+        chunks of KB files whose hash and chunk texts match the persisted index are
+        not re-embedded: their vectors stay in the saved index, the vectors of
+        changed or deleted files are removed from it and the new ones appended.
+
+        `files` yields (file name, sha256, chunk texts), e.g. iter_kb_chunks; by
+        default the chunks read by load_and_chunk. New chunks are embedded every
+        EMBED_BATCH_CHUNKS as they arrive, so a streaming source never has to be
+        chunked in full before embedding starts.
+        """
+        cached = self.load_cache()
+        previous = {}
+        if cached is not None:
+            for meta in cached["metadata"]:
+                previous.setdefault(meta["file"], []).append(meta["text"])
+        if files is None:
+            files = self.loaded_files()
+
+        reused, new_metadata, new_embeddings, pending = set(), [], [], []
+        try:
+            for file_name, sha256, texts in files:
+                self.file_hashes[file_name] = sha256
+                if cached is not None and cached["files"].get(file_name) == sha256 and previous.get(file_name) == list(texts):
+                    reused.add(file_name)
                     continue
-                
-                # If it's a new bullet point, break the previous chunk
-                if line.startswith('* ') or line.startswith('- ') or line.startswith('¿') or (len(line)>2 and line[1]=='.' and line[0].isdigit()) or line.startswith('•'):
-                    if current_chunk:
-                        chunk_text = " ".join(current_chunk).strip()
-                        if current_header and not chunk_text.startswith(current_header):
-                            chunk_text = f"{current_header}: {chunk_text}"
-                        if len(chunk_text) > 15:
-                            chunk_text = re.sub(r'\s+', ' ', chunk_text).strip()
-                            self.chunks.append(chunk_text)
-                            self.metadata.append({"file": file_name, "text": chunk_text})
-                    current_chunk = [line]
-                else:
-                    current_chunk.append(line)
-                    
-            if current_chunk:
-                chunk_text = " ".join(current_chunk).strip()
-                if current_header and not chunk_text.startswith(current_header):
-                    chunk_text = f"{current_header}: {chunk_text}"
-                if len(chunk_text) > 15:
-                    chunk_text = re.sub(r'\s+', ' ', chunk_text).strip()
-                    self.chunks.append(chunk_text)
-                    self.metadata.append({"file": file_name, "text": chunk_text})
-
-    def build_index(self):
-        print(f"Embedding {len(self.chunks)} chunks...")
-        embeddings = self.model.encode(self.chunks, normalize_embeddings=True)
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(np.array(embeddings).astype('float32'))
-        print("Index build successfully.")
+                pending.extend({"file": file_name, "text": text} for text in texts)
+                if len(pending) >= EMBED_BATCH_CHUNKS:
+                    new_embeddings.append(self.embed_chunks(pending))
+                    new_metadata.extend(pending)
+                    pending = []
+            if pending:
+                new_embeddings.append(self.embed_chunks(pending))
+                new_metadata.extend(pending)
+        finally:
+            self.stop_encode_pool()
+        logger.info("Embedded %d chunks (%d loaded from cache).", len(new_metadata), sum(len(previous[f]) for f in reused))
+
+        index = None
+        if reused:
+            keep = np.array([i for i, meta in enumerate(cached["metadata"]) if meta["file"] in reused], dtype='int64')
+            stale = np.setdiff1d(np.arange(len(cached["metadata"]), dtype='int64'), keep)
+            metadata = [cached["metadata"][i] for i in keep]
+            embeddings = np.asarray(cached["embeddings"][keep], dtype='float32')
+            # Another backend reuses the saved embeddings but builds its own index
+            if cached["index_config"] == self.index_config():
+                index = cached["index"]
+                if len(stale) and self.index_type in ("flat", "flat_fp16"):
+                    # Flat storage compacts on removal, so positions stay aligned with metadata
+                    index.remove_ids(stale)
+                elif len(stale) and self.index_type == "hnsw":
+                    # HNSW graphs cannot drop vectors
+                    index = None
+                elif len(stale):
+                    # IVF keeps the removed ids' gaps: refill the trained lists instead of retraining
+                    index.reset()
+                    index.add(embeddings)
+        else:
+            metadata = []
+            embeddings = np.empty((0, self.model.get_sentence_embedding_dimension()), dtype='float32')
+
+        if new_metadata:
+            new_embeddings = np.vstack(new_embeddings)
+            embeddings = np.vstack([embeddings, new_embeddings])
+            if index is not None:
+                index.add(new_embeddings)
+        if index is None:
+            index = create_index(embeddings, self.index_type, self.metric, **self.index_params)
+        self.index = index
+        self.set_search_params()
+
+        # Vectors of reused files keep their saved positions, so metadata follows the index order
+        self.metadata = metadata + new_metadata
+        self.chunks = [meta["text"] for meta in self.metadata]
+        self.embeddings = embeddings
+        self.build_lexical_index()
+        self.answer_cache.clear()
+        if self.cache_dir and (new_metadata or cached is None or len(self.metadata) != len(cached["metadata"])
+                               or cached["index_config"] != self.index_config()):
+            self.save_cache()
+        elif cached is not None:
+            self.snapshot = cached["snapshot"]
+        logger.info("Index build successfully.")
+
+    def load_index(self):
+        """
+        Serves the current persisted snapshot as is, without reading the KB or
+        running the model: index, embeddings and metadata are memory-mapped
+        read-only, so every process serving the snapshot shares one copy through
+        the page cache. The build settings are taken from the snapshot. Returns
+        False when there is no usable snapshot.
+        """
+        cached = self.load_cache(mmap=True)
+        if cached is None:
+            return False
+        config = cached["index_config"]
+        self.index_type, self.metric = config["index_type"], config["metric"]
+        self.index_params = {**self.index_params, **config["params"]}
+        self.index = cached["index"]
+        self.embeddings = cached["embeddings"]
+        self.metadata = cached["metadata"]
+        self.chunks = self.metadata.columns["text"]
+        self.file_hashes = dict(cached["files"])
+        self.snapshot = cached["snapshot"]
+        self.set_search_params()
+        self.build_lexical_index()
+        logger.info("Mapped index snapshot %s (%d chunks).", self.snapshot, len(self.metadata))
+        return True
+
+    def reloaded(self):
+        """
+        A copy of this system serving the newly published snapshot, or None if the
+        loaded one is still current. Models are shared with this instance; the
+        index, lexical index and answer cache are the copy's own, so the swap is
+        atomic for callers holding either instance.
+        """
+        if not self.cache_dir or current_snapshot(self.cache_dir) in (None, self.snapshot):
+            return None
+        rag = copy.copy(self)
+        rag.index_params = dict(self.index_params)
+        rag.answer_cache = AnswerCache(self.answer_cache.max_entries, self.answer_cache.ttl_seconds,
+                                       self.answer_cache.semantic_distance)
+        return rag if rag.load_index() else None
+
+    def loaded_files(self):
+        files = {}
+        for meta in self.metadata:
+            files.setdefault(meta["file"], []).append(meta["text"])
+        for file_name, texts in files.items():
+            yield file_name, self.file_hashes.get(file_name), texts
+
+    def embed_chunks(self, metadata):
+        """Annotates a batch of new chunks (see annotate) and returns their normalized embeddings."""
+        self.annotate(metadata)
+        return self.encode_texts([meta["text"] for meta in metadata])
+
+    def encode_texts(self, texts):
+        """
+        Normalized float32 embeddings of texts, in their order. SentenceTransformer.encode
+        already sorts its input by length so each batch pads to similar lengths. The encode
+        pool (encode_workers > 1) splits texts into contiguous chunks before that sort, so
+        they are sorted longest first here to give each worker chunks of similar lengths.
+        """
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype='float32')
+        if not (self.encode_workers and self.encode_workers > 1 and len(texts) > self.encode_batch_size):
+            return np.asarray(self.model.encode(texts, batch_size=self.encode_batch_size, normalize_embeddings=True),
+                              dtype='float32')
+        if self.encode_pool is None:
+            self.encode_pool = self.model.start_multi_process_pool(['cpu'] * self.encode_workers)
+        order = np.argsort([-len(text) for text in texts], kind='stable')
+        embeddings = np.empty((len(texts), self.model.get_sentence_embedding_dimension()), dtype='float32')
+        embeddings[order] = self.model.encode_multi_process([texts[i] for i in order], self.encode_pool,
+                                                            batch_size=self.encode_batch_size,
+                                                            normalize_embeddings=True)
+        return embeddings
+
+    def stop_encode_pool(self):
+        if self.encode_pool is not None:
+            self.model.stop_multi_process_pool(self.encode_pool)
+            self.encode_pool = None
+
+    def build_lexical_index(self):
+        """
+        Inverted indexes over the annotated chunks: BM25 postings per lemma, and for
+        each technical term the chunks whose lemmas or normalized text contain it
+        (the chunk-level check ask() applies), so neither is re-evaluated per query.
+        """
+        self.lexical = LexicalIndex(metadata_column(self.metadata, "lemmas"))
+        normalized = metadata_column(self.metadata, "normalized")
+        self.tech_chunks = {}
+        for term in TECH_DICTIONARY:
+            chunks = {int(i) for i in self.lexical.chunks_with(term)}
+            chunks.update(i for i, text in enumerate(normalized) if term in text)
+            self.tech_chunks[term] = frozenset(chunks)
+
+    def index_config(self):
+        """Build-time settings of the index; search-time ones (nprobe, ef_search) can change freely."""
+        params = {key: value for key, value in self.index_params.items() if key not in ("nprobe", "ef_search")}
+        return {"index_type": self.index_type, "metric": self.metric, "params": params}
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Tunes recall against latency of the IVF (nprobe) and HNSW (ef_search) backends."""
+        if nprobe is not None:
+            self.index_params["nprobe"] = nprobe
+        if ef_search is not None:
+            self.index_params["ef_search"] = ef_search
+        configure_search(self.index, nprobe=self.index_params["nprobe"], ef_search=self.index_params["ef_search"])
+        self.answer_cache.clear()
+
+    def load_cache(self, mmap=False):
+        """The current persisted snapshot for this model, or None if missing, incomplete or of another layout."""
+        if not self.cache_dir:
+            return None
+        try:
+            cached = read_snapshot(self.cache_dir, mmap=mmap)
+        except (OSError, ValueError, RuntimeError, pa.ArrowException) as e:
+            logger.warning("Ignoring unreadable index cache in %s: %s", self.cache_dir, e)
+            return None
+        if cached is None or cached.get("version") != INDEX_CACHE_VERSION or cached.get("model_name") != self.model_key:
+            return None
+        if not cached["index"].ntotal == len(cached["embeddings"]) == len(cached["metadata"]):
+            return None
+        return cached
+
+    def save_cache(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = {meta["file"]: self.file_hashes.get(meta["file"]) for meta in self.metadata}
+        self.snapshot = write_snapshot(self.cache_dir, {
+            "version": INDEX_CACHE_VERSION,
+            "model_name": self.model_key,
+            "index_config": self.index_config(),
+            "files": files,
+        }, self.index, self.embeddings, self.metadata)
+
+    def embed_query(self, text):
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts):
+        return np.array(self.model.encode(texts, batch_size=self.encode_batch_size,
+                                          normalize_embeddings=True)).astype('float32').reshape(len(texts), -1)
+
+    def search(self, text, k, query_embedding=None):
+        """FAISS ids and squared L2 distances of the k nearest chunks, plus the query embedding."""
+        if query_embedding is None:
+            query_embedding = self.embed_query(text)
+        indices, distances = self.search_embeddings(query_embedding[np.newaxis], k)[0]
+        return indices, distances, query_embedding
+
+    def search_embeddings(self, query_embeddings, k):
+        """One FAISS search for a matrix of query embeddings: (ids, squared L2 distances) per row."""
+        distances, indices = self.index.search(query_embeddings, k)
+        distances = to_l2(distances, self.metric)
+        found = indices != -1
+        return [(row[mask], dist[mask]) for row, dist, mask in zip(indices, distances, found)]
 
     def query(self, text, k=3):
         if self.index is None:
             return [], []
-        
-        query_embedding = self.model.encode([text], normalize_embeddings=True)
-        distances, indices = self.index.search(np.array(query_embedding).astype('float32'), k)
-        
-        results = []
-        scores = []
-        for d, idx in zip(distances[0], indices[0]):
-            if idx != -1:
-                results.append(self.metadata[idx])
-                scores.append(float(d))
-        
-        return results, scores
+        indices, distances, _ = self.search(text, k)
+        return [self.metadata[idx] for idx in indices], [float(d) for d in distances]
 
     def get_lemmas(self, text):
         if not self.nlp:
             return text.lower().split()
-        doc = self.nlp(text.lower())
+        return self.doc_lemmas(self.nlp(text.lower()))
+
+    @staticmethod
+    def doc_lemmas(doc):
         # Filter stopwords and punctuation
         return [token.lemma_ for token in doc if not token.is_stop and not token.is_punct and len(token.text) > 1]
 
+    def annotate(self, metadata, batch_size=256):
+        """Stores the accent-stripped lemmas and lowercase text of each chunk, as ask() compares them."""
+        texts = [meta["text"].lower() for meta in metadata]
+        if self.nlp:
+            lemmas = (self.doc_lemmas(doc) for doc in self.nlp.pipe(texts, batch_size=batch_size))
+        else:
+            lemmas = (text.split() for text in texts)
+        for meta, text, chunk_lemmas in zip(metadata, texts, lemmas):
+            meta["lemmas"] = sorted({strip_accents(lemma) for lemma in chunk_lemmas})
+            meta["normalized"] = strip_accents(text)
+
     def ask(self, question):
-        k = 15
+        """Answer to the question, from the answer cache when it (or a near-identical question) was asked before."""
+        return self.ask_batch([question])[0]
+
+    def ask_batch(self, questions):
+        """
+        Answers to several questions. Those not in the answer cache are embedded
+        in one forward pass and searched in one FAISS call; questions with the
+        same cache key are answered once.
+        """
+        keys = [normalize_question(question) for question in questions]
+        texts = dict(zip(reversed(keys), reversed(questions)))
+        answers = {key: self.answer_cache.get(key) for key in texts}
+        pending = [key for key, answer in answers.items() if answer is None]
+        if not pending:
+            return [answers[key] for key in keys]
+
+        timings = {}
+        if self.index is None:
+            embeddings = [None] * len(pending)
+        else:
+            start = time.perf_counter()
+            embeddings = self.embed_queries([texts[key].lower() for key in pending])
+            timings["embed"] = time.perf_counter() - start
+        misses = []
+        for key, query_embedding in zip(pending, embeddings):
+            answers[key] = self.answer_cache.get_similar(query_embedding)
+            if answers[key] is not None:
+                self.answer_cache.put(key, answers[key])
+            else:
+                misses.append((key, query_embedding))
+        if misses and self.index is not None:
+            start = time.perf_counter()
+            dense = self.search_embeddings(np.stack([emb for _, emb in misses]), ASK_TOP_K)
+            timings["search"] = time.perf_counter() - start
+        else:
+            dense = [None] * len(misses)
+        if self.on_timings and timings:
+            self.on_timings(timings)
+        for (key, query_embedding), hits in zip(misses, dense):
+            stage_timings = {}
+            answers[key] = self.answer(texts[key], query_embedding, hits, stage_timings)
+            self.answer_cache.put(key, answers[key], query_embedding)
+            if self.on_timings and stage_timings:
+                self.on_timings(stage_timings)
+        return [answers[key] for key in keys]
+
+    def answer(self, question, query_embedding=None, hits=None, timings=None):
+        """
+        Uncached answer; `hits` are the question's (ids, distances) when already
+        searched (see ask_batch). `timings` collects the seconds of each stage run.
+        """
+        timings = {} if timings is None else timings
+        k = ASK_TOP_K
         question_lower = question.lower()
         
         # Volvemos a usar la pregunta en minúscula para evitar problemas de sensibilidad a mayúsculas
-        results, scores = self.query(question_lower, k=k)
+        if self.index is None:
+            indices, distances = [], []
+        elif hits is not None:
+            indices, distances = hits
+        else:
+            indices, distances, query_embedding = self.search(question_lower, k, query_embedding)
         
-        if not results:
+        if not len(indices):
             return (
                 "Lo siento, la información solicitada no se encuentra en la base de conocimientos técnica."
             )
             
-        def strip_accents(s):
-            return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-        
         # Clean question words for exact matching or noise detection
+        start = time.perf_counter()
         question_words = set([strip_accents(w.strip('?,.¿()¡!')) for w in question_lower.split() if len(w.strip('?,.¿()¡!')) > 1])
         question_lemmas = set([strip_accents(lemma) for lemma in self.get_lemmas(question_lower)])
-        
-        # Diccionario técnico para validar acrónimos y términos clave (Usamos lemas/raíces)
-        tech_dictionary = {
-            "cups", "dx", "kpi", "json", "parquet", "bigquery", "airflow", "cala", "web", "app", "call", 
-            "medico", "diagnostico", "atencion", "facturado", "calidad", "error", "tasa", "arquitectura", 
-            "propuesta", "pipeline", "transaccional", "procesamiento", "duplicado", "limpieza", 
-            "ciudad", "clasificacion", "salud", "procedimiento", "cie-10", "identificar", "intervencion",
-            "login", "click", "compra", "autenticacion", "interaccion", "digital", "politica", "total", 
-            "promedio", "evento", "instruccion", "prueba", "cliente", "csv", "json_detalle", "orquestacion", 
-            "gcp", "nube", "fallo", "sistema", "valido", "procesada", "descartado", "facturacion",
-            "distribucion", "canal", "alfanumerico", "estandarizada", "reporte", "resultado", "financiero",
-            "documento", "limpiar", "objetivo", "insumo", "particion", "consulta", "optimizado", 
-            "idempotente", "despliegue", "composer", "faiss", "endpoint", "health", "ask", "tecnico", "tecnica"
-        }
-        
-        # Bloqueo explícito de ruidos conocidos
-        noise_triggers = {"sol", "pizza", "color", "clima", "mundial", "dolar", "helado", "avion", "gato", "presidente", "musica", "hambre", "francia", "pasta", "precio", "capital", "vendes", "volar", "receta", "cuanto", "mas"}
+        timings["lemmatize"] = time.perf_counter() - start
         
         # Validación técnica basada en lemas
-        tech_overlap = question_lemmas.intersection(tech_dictionary)
+        tech_overlap = question_lemmas.intersection(TECH_DICTIONARY)
         if not tech_overlap:
-            tech_overlap = question_words.intersection(tech_dictionary)
+            tech_overlap = question_words.intersection(TECH_DICTIONARY)
         is_technical_query = bool(tech_overlap)
         
         # Bloqueo de ruido: Si tiene disparador de ruido Y NO es técnico, bloquear.
-        if (question_words.intersection(noise_triggers)) and not is_technical_query:
+        if (question_words.intersection(NOISE_TRIGGERS)) and not is_technical_query:
              return "Lo siento, no tengo información sobre temas fuera del dominio de CALA Analytics. Mi especialidad son los procesos, KPIs y definiciones técnicas del proyecto."
 
+        start = time.perf_counter()
+        # CANDIDATOS HÍBRIDOS: unión del top-k denso y el top-k BM25 por lemas; BM25 solo aporta
+        # candidatos, el orden final lo da la distancia L2 ajustada por el reranking de abajo
+        dense_scores = {int(idx): float(d) for idx, d in zip(indices, distances)}
+        lexical_ids, _ = self.lexical.search(question_lemmas, k)
+        candidates = candidate_union(indices, lexical_ids)
+        # Los aciertos léxicos fuera del top-k denso se puntúan con su distancia L2 exacta
+        extra = [idx for idx in candidates if idx not in dense_scores]
+        if extra:
+            exact = ((np.asarray(self.embeddings[extra]) - query_embedding) ** 2).sum(axis=1)
+            dense_scores.update(zip(extra, exact.tolist()))
+
         # ELEGIR EL MEJOR RESULTADO (CON RERANKING LEXICAL)
         scored_results = []
-        for res, original_score in zip(results, scores):
-            text_lower = res['text'].lower()
-            text_lemmas = set([strip_accents(lemma) for lemma in self.get_lemmas(res['text'])])
-            
+        for idx in candidates:
+            res, original_score = self.metadata[idx], dense_scores[idx]
             # Validar si este documento específico contiene la palabra técnica de la pregunta
             chunk_has_tech = False
-            if is_technical_query:
-                chunk_has_tech = any(w in text_lemmas or w in strip_accents(text_lower) for w in tech_overlap)
+            if is_technical_query and "lemmas" in res:
+                chunk_has_tech = any(idx in self.tech_chunks[w] for w in tech_overlap)
+            elif is_technical_query:
+                # Chunks without index-time annotations (see annotate) are checked directly
+                text_lemmas = set([strip_accents(lemma) for lemma in self.get_lemmas(res['text'])])
+                chunk_has_tech = any(w in text_lemmas or w in strip_accents(res['text'].lower()) for w in tech_overlap)
             
             # BONUS LEXICAL: Reranking para priorizar glosarios
             adjusted_score = original_score
@@ -201,7 +525,9 @@ class RAGSystem:
             
         # Reordenamos por el score ajustado (menor es mejor en FAISS L2)
         scored_results.sort(key=lambda x: x[1])
+        timings["rerank"] = time.perf_counter() - start
         
+        start = time.perf_counter()
         best_candidate = None
         best_score = 999
         
@@ -211,6 +537,7 @@ class RAGSystem:
                 best_candidate = res
                 best_score = max(0.01, original_score) # Retenemos el puntaje real para el % de confianza
                 break
+        timings["select"] = time.perf_counter() - start
         
         if best_candidate is None:
             return (
@@ -228,6 +555,7 @@ class RAGSystem:
         return response
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     rag = RAGSystem(kb_dir="data/raw/kb")
     rag.load_and_chunk()
     rag.build_index()
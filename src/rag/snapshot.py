@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import time
+from collections.abc import Sequence
+
+import numpy as np
+import pyarrow as pa
+
+# Persisted RAG index. Each build is written to its own snapshot directory (index.faiss,
+# embeddings.npy, metadata.arrow and snapshot.json) and published by rewriting the CURRENT
+# pointer file, so readers never see a half-written index and detect a new one by the pointer.
+
+# Snapshots kept besides the current one, for workers that have not reloaded yet
+KEEP_PREVIOUS_SNAPSHOTS = 1
+POINTER_FILE = "CURRENT"
+
+
+def mmap_flags(index_type):
+    """
+    faiss read flags that memory-map an index: IO_FLAG_MMAP maps IVF inverted lists,
+    IO_FLAG_MMAP_IFC the codes of flat, SQ and HNSW storage. Releases without
+    IO_FLAG_MMAP_IFC (requirements.txt pins one that has it) read those indexes
+    into memory, one private copy per worker.
+    """
+    import faiss
+
+    if index_type in ("ivf", "ivfpq"):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+
+
+def write_atomic(path, write, mode='wb', **kwargs):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode, **kwargs) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class MappedColumn(Sequence):
+    """Read-only list view of an Arrow column; values are converted on access."""
+
+    def __init__(self, column):
+        self.column = column
+
+    def __len__(self):
+        return len(self.column)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self.column[i].as_py()
+
+
+class MappedMetadata(Sequence):
+    """Read-only list of chunk metadata dicts over a memory-mapped Arrow table."""
+
+    def __init__(self, table):
+        self.columns = {name: MappedColumn(table.column(name)) for name in table.column_names}
+        self.size = table.num_rows
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if not -self.size <= i < self.size:
+            raise IndexError(i)
+        return {name: column[i] for name, column in self.columns.items()}
+
+
+def metadata_column(metadata, name):
+    """One field of every chunk, without building per-chunk dicts for mapped metadata."""
+    if isinstance(metadata, MappedMetadata):
+        return metadata.columns[name].column.to_pylist()
+    return [meta[name] for meta in metadata]
+
+
+def current_snapshot(root):
+    """Name of the published snapshot under root, or None."""
+    try:
+        with open(os.path.join(root, POINTER_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def write_snapshot(root, header, index, embeddings, metadata):
+    """Writes a new snapshot, points CURRENT to it and prunes old ones. Returns its name."""
+    # faiss is imported where it is used, so importing the API (which imports this module) does not load it
+    import faiss
+
+    name = f"{time.time_ns():x}"
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    faiss.write_index(index, os.path.join(path, "index.faiss"))
+    np.save(os.path.join(path, "embeddings.npy"), np.asarray(embeddings))
+    table = pa.table({key: [meta[key] for meta in metadata] for key in ("file", "text", "lemmas", "normalized")},
+                     schema=pa.schema([("file", pa.string()), ("text", pa.string()),
+                                       ("lemmas", pa.list_(pa.string())), ("normalized", pa.string())]))
+    with pa.OSFile(os.path.join(path, "metadata.arrow"), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    with open(os.path.join(path, "snapshot.json"), 'w', encoding='utf-8') as f:
+        json.dump({**header, "chunks": len(metadata)}, f, ensure_ascii=False)
+    # Published last: until then readers keep the previous snapshot
+    write_atomic(os.path.join(root, POINTER_FILE), lambda f: f.write(name), mode='w', encoding='utf-8')
+    prune_snapshots(root, name)
+    return name
+
+
+def prune_snapshots(root, current):
+    snapshots = sorted((entry for entry in os.listdir(root)
+                        if entry != current and os.path.isdir(os.path.join(root, entry))), reverse=True)
+    for stale in snapshots[KEEP_PREVIOUS_SNAPSHOTS:]:
+        # Workers still mapping a removed snapshot keep reading it until they reload (POSIX unlink semantics)
+        shutil.rmtree(os.path.join(root, stale), ignore_errors=True)
+
+
+def read_snapshot(root, mmap=False):
+    """
+    The current snapshot: its header plus "snapshot", "index", "embeddings" and
+    "metadata", or None if there is none. With mmap the index, the embeddings and
+    the metadata are memory-mapped read-only, so processes reading the same
+    snapshot share its pages; otherwise the index is loaded in memory (mutable)
+    and the metadata as a list of dicts.
+    """
+    import faiss
+
+    name = current_snapshot(root)
+    if name is None:
+        return None
+    path = os.path.join(root, name)
+    with open(os.path.join(path, "snapshot.json"), 'r', encoding='utf-8') as f:
+        snapshot = json.load(f)
+    snapshot["snapshot"] = name
+    index_path = os.path.join(path, "index.faiss")
+    if mmap:
+        snapshot["index"] = faiss.read_index(index_path, mmap_flags(snapshot["index_config"]["index_type"]))
+    else:
+        snapshot["index"] = faiss.read_index(index_path)
+    snapshot["embeddings"] = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='r')
+    table = pa.ipc.open_file(pa.memory_map(os.path.join(path, "metadata.arrow"))).read_all()
+    snapshot["metadata"] = MappedMetadata(table) if mmap else table.to_pylist()
+    return snapshot
@@ -2,10 +2,15 @@ import sys
 import os
 import time
 import io
+import asyncio
+import argparse
 from contextlib import redirect_stdout
 
+import numpy as np
+
 project_root = os.getcwd()
 sys.path.append(project_root)
+from src.api.batching import MicroBatcher
 from src.rag.rag_engine import RAGSystem
 
 # Preguntas exhaustivas cubriendo el 100% de la base de conocimientos
@@ -90,6 +95,9 @@ noise_queries = [
     "receta de pasta", "el sol brilla mucho", "capital de francia"
 ]
 
+def is_denied(ans):
+    return "Lo siento" in ans or "IA encontró un tema" in ans
+
 def run_stress_test():
     rag = RAGSystem(kb_dir='data/raw/kb')
     rag.load_and_chunk()
@@ -106,9 +114,9 @@ def run_stress_test():
         with redirect_stdout(f):
             ans = rag.ask(q)
         debug_output = f.getvalue().strip()
-        is_denied = "Lo siento" in ans or "IA encontró un tema" in ans
-        status = "FAIL" if is_denied else "PASS"
-        if not is_denied: tech_passed += 1
+        denied = is_denied(ans)
+        status = "FAIL" if denied else "PASS"
+        if not denied: tech_passed += 1
         
         print(f"  Result: {status}")
         if debug_output: print(f"  Debug: {debug_output}")
@@ -121,9 +129,9 @@ def run_stress_test():
         with redirect_stdout(f):
             ans = rag.ask(q)
         debug_output = f.getvalue().strip()
-        is_denied = "Lo siento" in ans or "IA encontró un tema" in ans
-        status = "PASS (Rejected)" if is_denied else "FAIL (Hallucinated)"
-        if is_denied: noise_rejected += 1
+        denied = is_denied(ans)
+        status = "PASS (Rejected)" if denied else "FAIL (Hallucinated)"
+        if denied: noise_rejected += 1
         
         print(f"  Result: {status}")
         if debug_output: print(f"  Debug: {debug_output}")
@@ -135,5 +143,54 @@ def run_stress_test():
     print(f"Noise Rejection Rate: {noise_rejected}/{len(noise_queries)}")
     print("="*80)
 
+async def run_clients(ask, questions, clients, requests_per_client):
+    # Cada cliente envía sus preguntas una tras otra (lazo cerrado), todos a la vez
+    latencies = []
+    async def client(offset):
+        for i in range(requests_per_client):
+            start = time.perf_counter()
+            await ask(questions[(offset + i) % len(questions)])
+            latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    return clients * requests_per_client / (time.perf_counter() - start), np.array(latencies) * 1000
+
+async def measure_concurrency(rag, levels, requests_per_client):
+    questions = tech_queries + noise_queries
+    results = []
+    for clients in levels:
+        # Ruta anterior: cada petición llama ask() por separado en el threadpool de Starlette
+        unbatched = await run_clients(lambda q: asyncio.to_thread(rag.ask, q), questions, clients, requests_per_client)
+        batcher = MicroBatcher(rag.ask_batch)
+        await batcher.start()
+        try:
+            batched = await run_clients(batcher.submit, questions, clients, requests_per_client)
+        finally:
+            await batcher.stop()
+        results += [(clients, "per-request", *unbatched), (clients, "micro-batched", *batched)]
+    return results
+
+def run_concurrency_test(levels=(1, 8, 64), requests_per_client=20):
+    # Sin caché de respuestas, para medir embedding + búsqueda en cada petición
+    with redirect_stdout(io.StringIO()):
+        rag = RAGSystem(kb_dir='data/raw/kb', answer_cache_size=0)
+        rag.index_kb()
+        rag.ask(tech_queries[0])
+    results = asyncio.run(measure_concurrency(rag, levels, requests_per_client))
+
+    print("\n" + "="*80)
+    print(f"CONCURRENCY TEST ({requests_per_client} requests per client)")
+    print("="*80)
+    print(f"{'clients':>8}  {'mode':<15}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for clients, mode, qps, ms in results:
+        print(f"{clients:>8}  {mode:<15}{qps:>10.1f}{np.percentile(ms, 50):>10.1f}{np.percentile(ms, 99):>10.1f}")
+    print("="*80)
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG stress test")
+    parser.add_argument("--concurrency", action="store_true",
+                        help="Also measure throughput and p99 latency at 1, 8 and 64 concurrent clients")
+    args = parser.parse_args()
     run_stress_test()
+    if args.concurrency:
+        run_concurrency_test()